@@ -5,7 +5,10 @@ Flask application initialization
 from flask import Flask, jsonify, render_template, g
 from .config import Config
 from .database import init_db, init_app as init_database
-from .services.gammu_service import GammuService
+from .services.sms_queue import SMSDispatcher
+from .services.modem_pool import ModemPool
+from .services.modem_owner import ModemOwnerLock, ModemOwnerElection
+from .services.retention import RetentionJob
 from .logging_config import setup_logging
 import atexit
 import signal
@@ -17,9 +20,19 @@ import os
 loggers = setup_logging()
 logger = loggers['app']
 
-# Global Gammu service instance
+# Global Gammu service instance for the primary modem
 gammu_service = None
 
+# Global modem pool and background workers
+modem_pool = None
+sms_dispatcher = None
+health_poller = None
+retention_job = None
+
+# Only the process holding this lock drives the modems
+modem_owner_lock = None
+owner_election = None
+
 # Shutdown event for graceful termination
 shutdown_event = threading.Event()
 
@@ -28,13 +41,39 @@ def signal_handler(signum, frame):
     signal_name = signal.Signals(signum).name
     logger.info(f"Received signal {signal_name}")
     shutdown_event.set()
-    cleanup_gammu()
+    cleanup_services()
     sys.exit(0)
 
+def cleanup_services():
+    """Stop background workers, then release the modems"""
+    if owner_election and owner_election.is_running():
+        owner_election.stop()
+    if retention_job and retention_job.is_running():
+        logger.info(f"Stopping {retention_job.name}")
+        try:
+            retention_job.stop()
+        except Exception as e:
+            logger.error(f"Error stopping {retention_job.name}: {e}")
+    if sms_dispatcher and sms_dispatcher.is_running():
+        logger.info(f"Stopping {sms_dispatcher.name}")
+        try:
+            sms_dispatcher.stop()
+        except Exception as e:
+            logger.error(f"Error stopping {sms_dispatcher.name}: {e}")
+    if modem_pool:
+        logger.info("Stopping modem pool")
+        modem_pool.stop()
+    cleanup_gammu()
+    if modem_owner_lock:
+        modem_owner_lock.release()
+
 def cleanup_gammu():
-    """Clean up Gammu service"""
+    """Clean up Gammu services"""
     global gammu_service
-    if gammu_service and gammu_service.is_connected():
+    if modem_pool:
+        logger.info("Disconnecting modem pool")
+        modem_pool.disconnect()
+    elif gammu_service and gammu_service.is_connected():
         logger.info("Cleaning up Gammu service")
         try:
             gammu_service.disconnect()
@@ -42,17 +81,38 @@ def cleanup_gammu():
         except Exception as e:
             logger.error(f"Error during Gammu cleanup: {e}")
 
-def create_app():
+def start_modem_services(app):
+    """Build the modem pool and start its workers; only the modem owner does this"""
+    global gammu_service, modem_pool, sms_dispatcher, health_poller, retention_job
+    modem_pool = ModemPool.from_config(app)
+    gammu_service = modem_pool.primary.gammu_service
+    health_poller = modem_pool.primary.health_poller
+    logger.info("Created Gammu service instances")
+
+    # Start a send worker and health poller per modem, then the dispatcher
+    # that spreads queued messages across them
+    sms_dispatcher = SMSDispatcher(app, modem_pool)
+    modem_pool.start()
+    sms_dispatcher.start()
+
+    # Old message history is archived by one process only, like the sending
+    if app.config['RETENTION_DAYS'] > 0:
+        retention_job = RetentionJob(app)
+        retention_job.start()
+
+def create_app(start_workers=True):
     """Create and configure the Flask application"""
     logger.info("Starting app creation")
     app = Flask(__name__)
     app.config.from_object(Config)
     logger.info("Loaded configuration")
 
-    # Register signal handlers
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
-    logger.info("Registered signal handlers")
+    # Register signal handlers; under gunicorn the worker's own handlers
+    # shut down gracefully and the worker_exit hook cleans up
+    if not os.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        signal.signal(signal.SIGTERM, signal_handler)
+        signal.signal(signal.SIGINT, signal_handler)
+        logger.info("Registered signal handlers")
 
     # Ensure required directories exist
     os.makedirs(app.instance_path, exist_ok=True)
@@ -64,13 +124,22 @@ def create_app():
         init_db()
     logger.info("Database initialized successfully")
 
-    # Initialize Gammu service
-    global gammu_service
-    gammu_service = GammuService()
-    logger.info("Creating Gammu service instance")
+    # With several web server processes only one may own the serial ports;
+    # the rest just enqueue and keep trying to take over if the owner dies
+    global modem_owner_lock, owner_election
+    if start_workers:
+        lock_path = app.config['MODEM_LOCK_FILE'] or os.path.join(os.path.dirname(app.config['DATABASE']), 'modem.lock')
+        modem_owner_lock = ModemOwnerLock(lock_path)
+        if modem_owner_lock.try_acquire():
+            logger.info(f"Process {os.getpid()} is the modem owner")
+            start_modem_services(app)
+        else:
+            logger.info(f"Another process owns the modems; process {os.getpid()} will only enqueue")
+            owner_election = ModemOwnerElection(modem_owner_lock, lambda: start_modem_services(app))
+            owner_election.start()
 
     # Register cleanup function
-    atexit.register(cleanup_gammu)
+    atexit.register(cleanup_services)
     logger.info("Registered cleanup functions")
 
     # Register blueprints
@@ -90,18 +159,16 @@ def create_app():
         """Set up request context"""
         g.shutdown_event = shutdown_event
         g.gammu_service = gammu_service
+        g.modem_pool = modem_pool
+        g.sms_dispatcher = sms_dispatcher
+        g.health_poller = health_poller
 
     @app.teardown_appcontext
     def teardown_appcontext(exception=None):
         """Clean up request context"""
         if exception:
             logger.error(f"Error during request: {str(exception)}", exc_info=True)
-        # Close any open database connections
-        if hasattr(g, 'db'):
-            try:
-                g.db.close()
-            except Exception as e:
-                logger.error(f"Error closing database connection: {str(e)}")
+        # The database connection is returned to the pool by close_db
 
     @app.errorhandler(Exception)
     def handle_error(error):
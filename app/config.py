@@ -14,13 +14,84 @@ class Config:
     
     # Database configuration
     DATABASE = '/app/instance/database.db'
+    DATABASE_BACKUP_ON_MIGRATE = os.environ.get('DATABASE_BACKUP_ON_MIGRATE', 'true').lower() == 'true'
+
+    # SQLite connection settings, applied to every connection
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+    SQLITE_FOREIGN_KEYS = os.environ.get('SQLITE_FOREIGN_KEYS', 'true').lower() == 'true'
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -16000))  # negative values are KiB
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 134217728))  # bytes, 0 disables
+    SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8))  # idle connections kept open
     
     # Device configuration
     USB_DEVICE = os.environ.get('USB_DEVICE', '/dev/ttyUSB3')
     GAMMU_CONFIG = os.environ.get('GAMMU_CONFIG', '/etc/gammurc')
-    
+    # gammurc sections to drive, one modem each: 0 is [gammu], 1 is [gammu1], ...
+    GAMMU_SECTIONS = [int(section) for section in os.environ.get('GAMMU_SECTIONS', '0').split(',') if section.strip()]
+
+    # Modem session settings
+    GAMMU_PERSISTENT_SESSION = os.environ.get('GAMMU_PERSISTENT_SESSION', 'true').lower() == 'true'
+    GAMMU_PROBE_INTERVAL = float(os.environ.get('GAMMU_PROBE_INTERVAL', 60))  # seconds idle before probing
+    GAMMU_RECONNECT_ATTEMPTS = int(os.environ.get('GAMMU_RECONNECT_ATTEMPTS', 4))
+    GAMMU_RECONNECT_BASE_DELAY = float(os.environ.get('GAMMU_RECONNECT_BASE_DELAY', 1))  # seconds
+    GAMMU_RECONNECT_MAX_DELAY = float(os.environ.get('GAMMU_RECONNECT_MAX_DELAY', 30))  # seconds
+
+    # Only one process drives the modems; the others just enqueue
+    MODEM_LOCK_FILE = os.environ.get('MODEM_LOCK_FILE')  # defaults to modem.lock next to the database
+    MODEM_OWNER_RETRY_INTERVAL = float(os.environ.get('MODEM_OWNER_RETRY_INTERVAL', 10))  # seconds
+
+    # Dispatch queue settings
+    QUEUE_POLL_INTERVAL = float(os.environ.get('QUEUE_POLL_INTERVAL', 5))  # seconds
+    BULK_MAX_RECIPIENTS = int(os.environ.get('BULK_MAX_RECIPIENTS', 1000))
+    MODEM_MAX_OUTSTANDING = int(os.environ.get('MODEM_MAX_OUTSTANDING', 2))  # messages assigned per modem at once
+
+    # Retry of transient send failures; messages that run out of attempts are 'dead'
+    SEND_MAX_ATTEMPTS = int(os.environ.get('SEND_MAX_ATTEMPTS', 5))  # 1 disables retrying
+    SEND_RETRY_BASE_DELAY = float(os.environ.get('SEND_RETRY_BASE_DELAY', 30))  # seconds before the first retry
+    SEND_RETRY_MAX_DELAY = float(os.environ.get('SEND_RETRY_MAX_DELAY', 3600))  # seconds
+
+    # Claimed messages hold a lease; an expired one means the sender crashed mid-send
+    SEND_LEASE_TIMEOUT = float(os.environ.get('SEND_LEASE_TIMEOUT', 300))  # seconds
+    STALE_SEND_POLICY = os.environ.get('STALE_SEND_POLICY', 'requeue').lower()  # requeue (at-least-once) or fail
+
+    # Send outcomes are committed in batches rather than one transaction each
+    STATUS_FLUSH_INTERVAL_MS = float(os.environ.get('STATUS_FLUSH_INTERVAL_MS', 200))  # milliseconds
+    STATUS_FLUSH_ROWS = int(os.environ.get('STATUS_FLUSH_ROWS', 100))  # flush early once this many are waiting
+    STATUS_FLUSH_MAX_ATTEMPTS = int(os.environ.get('STATUS_FLUSH_MAX_ATTEMPTS', 10))  # failed commits before a batch is dropped
+
+    # History retention: finished messages older than this are archived, then deleted
+    RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', 0))  # 0 keeps everything
+    RETENTION_ARCHIVE_DIR = os.environ.get('RETENTION_ARCHIVE_DIR', '')  # default: archive/ next to the database
+    RETENTION_CHUNK_SIZE = int(os.environ.get('RETENTION_CHUNK_SIZE', 500))  # rows per delete transaction
+    RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', 86400))  # seconds between runs
+
+    # Send pacing (token buckets); a rate or limit of 0 disables that bucket
+    MODEM_SEND_RATE = float(os.environ.get('MODEM_SEND_RATE', 1))  # messages per second per modem
+    MODEM_SEND_BURST = int(os.environ.get('MODEM_SEND_BURST', 5))  # messages sent back to back before pacing
+    MODEM_HOURLY_LIMIT = int(os.environ.get('MODEM_HOURLY_LIMIT', 300))  # messages per hour per SIM
+    DESTINATION_HOURLY_LIMIT = int(os.environ.get('DESTINATION_HOURLY_LIMIT', 10))  # messages per hour per number
+    DESTINATION_BURST = int(os.environ.get('DESTINATION_BURST', 3))  # messages to one number back to back
+
+    # Delivery reports and inbox
+    DELIVERY_REPORTS = os.environ.get('DELIVERY_REPORTS', 'true').lower() == 'true'  # request status reports
+    INBOX_POLL_INTERVAL = float(os.environ.get('INBOX_POLL_INTERVAL', 30))  # seconds between reads of SIM storage
+    INBOX_PART_TIMEOUT = float(os.environ.get('INBOX_PART_TIMEOUT', 3600))  # seconds to wait for missing parts
+
+    # Request rate limiting, counted per user and per client address
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower()  # memory or sqlite (shared by all workers)
+    RATE_LIMIT_WINDOW = float(os.environ.get('RATE_LIMIT_WINDOW', 60))  # seconds
+    RATE_LIMIT_MAX_REQUESTS = int(os.environ.get('RATE_LIMIT_MAX_REQUESTS', 30))  # per user per window
+    RATE_LIMIT_IP_MAX_REQUESTS = int(os.environ.get('RATE_LIMIT_IP_MAX_REQUESTS', 60))  # per address per window
+
+    # Health poller settings
+    HEALTH_POLL_INTERVAL = float(os.environ.get('HEALTH_POLL_INTERVAL', 30))  # seconds
+    HEALTH_STATIC_POLL_INTERVAL = float(os.environ.get('HEALTH_STATIC_POLL_INTERVAL', 3600))  # seconds
+
     # Application settings
     MAX_SMS_LENGTH = 160
+    MAX_SMS_SEGMENTS = int(os.environ.get('MAX_SMS_SEGMENTS', 6))  # parts a long message may be split into
     DEFAULT_TEMPLATE = 'Default'
     TIMEZONE = 'Europe/London'
     
@@ -2,32 +2,234 @@
 import sqlite3
 from flask import g, current_app
 import os
+import re
+import atexit
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def configure_connection(conn, config):
+    """Apply the configured PRAGMAs to a new connection"""
+    journal_mode = str(config.get('SQLITE_JOURNAL_MODE', 'WAL')).upper()
+    synchronous = str(config.get('SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f"Invalid SQLITE_JOURNAL_MODE: {journal_mode}")
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {synchronous}")
+
+    # busy_timeout first, so switching the journal mode waits for other writers
+    conn.execute(f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT', 5000))}")
+    # Only takes effect on a new file, and must come before the journal mode
+    # writes its header; existing files keep their mode until a VACUUM
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    active_mode = conn.execute(f'PRAGMA journal_mode = {journal_mode}').fetchone()[0]
+    if active_mode.upper() != journal_mode:
+        logger.warning(f"SQLite journal mode is {active_mode}, requested {journal_mode}")
+    conn.execute(f'PRAGMA synchronous = {synchronous}')
+    conn.execute(f"PRAGMA foreign_keys = {'ON' if config.get('SQLITE_FOREIGN_KEYS', True) else 'OFF'}")
+    conn.execute(f"PRAGMA cache_size = {int(config.get('SQLITE_CACHE_SIZE', -16000))}")
+    conn.execute(f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', 0))}")
+    return conn
+
+class ConnectionPool:
+    """Small pool of configured SQLite connections reused across requests.
+
+    Connections are opened and configured once, then handed back to the
+    thread that last used them where possible. At most max_size idle
+    connections are kept; extra ones are closed on release.
+    """
+
+    def __init__(self, database, config, max_size=8):
+        self.database = database
+        self.config = config
+        self.max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.discards = 0
+
+    def _connect(self):
+        """Open and configure a new connection"""
+        conn = sqlite3.connect(
+            self.database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        try:
+            configure_connection(conn, self.config)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def acquire(self):
+        """Take a connection, preferring the one this thread used last"""
+        preferred = getattr(self._local, 'conn', None)
+        conn = None
+        with self._lock:
+            if preferred is not None and preferred in self._idle:
+                self._idle.remove(preferred)
+                conn = preferred
+            elif self._idle:
+                conn = self._idle.pop()
+            if conn is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if conn is None:
+            conn = self._connect()
+        self._local.conn = conn
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, closing it if the pool is full"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.error(f"Discarding broken database connection: {str(e)}")
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return
+            self.discards += 1
+        conn.close()
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing database connection: {str(e)}")
+
+    def stats(self):
+        """Get pool usage counters"""
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'discards': self.discards
+            }
+
+def get_pool(app=None):
+    """Get the connection pool for an app, creating it on first use"""
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('sqlite_pool')
+    if pool is None:
+        pool = ConnectionPool(app.config['DATABASE'], app.config, app.config.get('SQLITE_POOL_SIZE', 8))
+        app.extensions['sqlite_pool'] = pool
+        atexit.register(pool.close_all)
+    return pool
+
 def get_db():
     """Get database connection"""
     if 'db' not in g:
         try:
-            g.db = sqlite3.connect(
-                current_app.config['DATABASE'],
-                detect_types=sqlite3.PARSE_DECLTYPES
-            )
-            g.db.row_factory = sqlite3.Row
+            g.db = get_pool().acquire()
         except Exception as e:
             logger.error(f"Failed to establish database connection: {str(e)}")
             raise
     return g.db
 
 def close_db(e=None):
-    """Close database connection"""
+    """Return the request's database connection to the pool"""
     db = g.pop('db', None)
     if db is not None:
         try:
-            db.close()
+            get_pool().release(db)
         except Exception as e:
-            logger.error(f"Error closing database connection: {str(e)}")
+            logger.error(f"Error releasing database connection: {str(e)}")
+
+def get_schema_version(db):
+    """Get the schema version recorded in the database file"""
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def _split_statements(sql):
+    """Split a migration script into complete SQL statements"""
+    statements = []
+    buffer = ''
+    for line in sql.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            if buffer.strip():
+                statements.append(buffer.strip())
+            buffer = ''
+    if buffer.strip():
+        statements.append(buffer.strip())
+    return statements
+
+def backup_database(db, version):
+    """Copy the database aside before migrating it"""
+    backup_path = f"{current_app.config['DATABASE']}.v{version}.bak"
+    target = sqlite3.connect(backup_path)
+    try:
+        db.backup(target)
+    finally:
+        target.close()
+    logger.info(f"Backed up database to {backup_path} before migrating")
+
+def apply_migrations(db):
+    """Apply pending versioned migrations from database/migrations"""
+    migrations_dir = os.path.join(current_app.root_path, '..', 'database', 'migrations')
+    if not os.path.isdir(migrations_dir):
+        return True
+
+    migrations = []
+    for filename in sorted(os.listdir(migrations_dir)):
+        match = re.match(r'^(\d+)_.*\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(migrations_dir, filename)))
+
+    current_version = get_schema_version(db)
+    target_version = migrations[-1][0] if migrations else current_version
+    if current_version >= target_version:
+        logger.info(f"Database schema is up to date (version {current_version})")
+        return True
+
+    logger.info(f"Migrating database schema from version {current_version} to {target_version}")
+    has_data = db.execute('SELECT 1 FROM messages LIMIT 1').fetchone() is not None
+    if has_data and current_app.config.get('DATABASE_BACKUP_ON_MIGRATE', True):
+        try:
+            backup_database(db, current_version)
+        except sqlite3.Error as e:
+            logger.error(f"Database backup failed, not migrating: {str(e)}")
+            return False
+
+    for version, path in migrations:
+        if version <= current_version:
+            continue
+        with open(path, 'r') as f:
+            statements = _split_statements(f.read())
+        try:
+            # Take the write lock first so concurrent workers apply each migration once
+            db.execute('BEGIN IMMEDIATE')
+            if get_schema_version(db) >= version:
+                db.rollback()
+                continue
+            for statement in statements:
+                db.execute(statement)
+            db.execute(f'PRAGMA user_version = {version}')
+            db.commit()
+            logger.info(f"Applied migration {os.path.basename(path)}")
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Migration {os.path.basename(path)} failed: {str(e)}")
+            return False
+    return True
 
 def init_db():
     """Initialize the database"""
@@ -49,6 +251,11 @@ def init_db():
         with open(schema_path, 'r') as f:
             db.executescript(f.read())
         db.commit()
+
+        # Bring existing databases up to the current schema version
+        if not apply_migrations(db):
+            logger.error("Database initialization failed: migrations could not be applied")
+            return False
         
         # Verify database was initialized correctly
         try:
@@ -2,7 +2,7 @@
 Custom exceptions for the SMS Tool application
 """
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import logging
 from enum import Enum
 
@@ -13,6 +13,7 @@ class ErrorCode(Enum):
     # General errors (1000-1999)
     UNKNOWN_ERROR = 1000
     CONFIGURATION_ERROR = 1001
+    GAMMU_INIT_FAILED = 1002
     
     # Device errors (2000-2999)
     DEVICE_NOT_FOUND = 2000
@@ -24,21 +25,32 @@ class ErrorCode(Enum):
     MODEM_NOT_RESPONDING = 3000
     MODEM_INITIALIZATION_FAILED = 3001
     MODEM_CONNECTION_FAILED = 3002
+    MODEM_NOT_FOUND = 3003
+    MODEM_BUSY = 3004
+    MODEM_OPEN_ERROR = 3005
+    MODEM_CONNECT_ERROR = 3006
+    MODEM_STATUS_ERROR = 3007
     
     # SIM errors (4000-4999)
     SIM_NOT_DETECTED = 4000
     SIM_PIN_REQUIRED = 4001
     SIM_PUK_REQUIRED = 4002
+    SIM_STATUS_ERROR = 4003
     
     # Network errors (5000-5999)
     NETWORK_NOT_REGISTERED = 5000
     NETWORK_REGISTRATION_DENIED = 5001
     NETWORK_TIMEOUT = 5002
+    NETWORK_ERROR = 5003
+    NETWORK_STATUS_ERROR = 5004
     
     # Message errors (6000-6999)
     MESSAGE_SEND_FAILED = 6000
     MESSAGE_INVALID_FORMAT = 6001
     MESSAGE_QUEUE_FULL = 6002
+    SMS_SEND_ERROR = 6003
+    SMS_READ_ERROR = 6004
+    SMS_PARTIALLY_SENT = 6005
 
 class SMSToolException(Exception):
     """Base exception class for SMS Tool"""
@@ -149,4 +161,19 @@ class DeviceError(GammuError):
         details: Optional[Dict[str, Any]] = None,
         original_error: Optional[Exception] = None
     ):
-        super().__init__(message, error_code, details, original_error) 
\ No newline at end of file
+        super().__init__(message, error_code, details, original_error) 
+
+class PartialSendError(GammuError):
+    """Raised when a multipart message failed after some of its parts went out"""
+    def __init__(
+        self,
+        message: str,
+        references: List[Optional[int]],
+        parts: int,
+        error_code: ErrorCode = ErrorCode.SMS_PARTIALLY_SENT,
+        details: Optional[Dict[str, Any]] = None,
+        original_error: Optional[Exception] = None
+    ):
+        super().__init__(message, error_code, details, original_error)
+        self.references = references
+        self.parts = parts
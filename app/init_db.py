@@ -10,7 +10,7 @@ logger = logging.getLogger('init_db')
 def main():
     """Main function to initialize the database"""
     try:
-        app = create_app()
+        app = create_app(start_workers=False)
         with app.app_context():
             # Check database connection
             try:
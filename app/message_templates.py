@@ -0,0 +1,79 @@
+"""
+Named-field substitution for message templates
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Any, Iterable, List, Tuple
+from .sms_encoding import analyze
+
+# {field} is a placeholder; {{ and }} stand for literal braces
+TOKEN_PATTERN = re.compile(r'\{\{|\}\}|\{([A-Za-z_][A-Za-z0-9_]*)\}')
+
+def normalize_field(name: str) -> str:
+    """Field name as matched against CSV headers: 'First Name' -> 'first_name'"""
+    return re.sub(r'\s+', '_', name.strip().lower())
+
+class MissingFieldsError(ValueError):
+    """Raised when a recipient has no value for some of a template's fields"""
+
+    def __init__(self, fields: List[str]):
+        super().__init__(f"Missing values for: {', '.join('{' + field + '}' for field in fields)}")
+        self.fields = fields
+
+class CompiledTemplate:
+    """A template split once into literal text and field names.
+
+    Rendering only joins the pieces, so filling in thousands of recipients
+    never re-parses the template.
+    """
+
+    def __init__(self, content: str):
+        self.content = content
+        pieces = []
+        literal = []
+        position = 0
+        for match in TOKEN_PATTERN.finditer(content):
+            literal.append(content[position:match.start()])
+            position = match.end()
+            if match.group(1) is None:
+                literal.append(match.group(0)[0])
+                continue
+            pieces.append(''.join(literal))
+            literal = []
+            pieces.append(normalize_field(match.group(1)))
+        literal.append(content[position:])
+        pieces.append(''.join(literal))
+        # Even indexes are literal text, odd indexes are field names
+        self.pieces: Tuple[str, ...] = tuple(pieces)
+        self.fields: Tuple[str, ...] = tuple(dict.fromkeys(pieces[1::2]))
+
+    def missing(self, values: Dict[str, Any]) -> List[str]:
+        """Fields with no (or an empty) value"""
+        return [field for field in self.fields if not str(values.get(field) or '').strip()]
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """Fill in every field; raises MissingFieldsError if any is missing"""
+        if not self.fields:
+            return self.pieces[0]
+        missing = self.missing(values)
+        if missing:
+            raise MissingFieldsError(missing)
+        pieces = list(self.pieces)
+        for index in range(1, len(pieces), 2):
+            pieces[index] = str(values[pieces[index]]).strip()
+        return ''.join(pieces)
+
+    def render_many(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Render once per row, with the encoding and segment count of each result"""
+        results = []
+        for row in rows:
+            text = self.render(row)
+            info = analyze(text)
+            results.append({'text': text, 'encoding': info['encoding'], 'segments': info['segments']})
+        return results
+
+@lru_cache(maxsize=256)
+def compile_template(content: str) -> CompiledTemplate:
+    """Parse a template, reusing the compiled form for content seen before"""
+    return CompiledTemplate(content)
@@ -4,11 +4,15 @@ Database models
 
 import sqlite3
 import os
-from datetime import datetime
+import threading
+import base64
+import json
+from datetime import datetime, timedelta
 import pytz
 from .config import Config
 import logging
 from .database import get_db, init_db  # Database utility functions
+from .sms_encoding import count_segments
 
 logger = logging.getLogger(__name__)
 
@@ -64,6 +68,22 @@ class User:
             logger.error(f"Error creating user: {str(e)}")
             return False
 
+    @staticmethod
+    def has_history(username):
+        """Check if a user has sent messages or saved templates, which keep them from being deleted"""
+        db = get_db()
+        try:
+            row = db.execute('''
+                SELECT EXISTS (SELECT 1 FROM messages WHERE sender_id = u.id)
+                    OR EXISTS (SELECT 1 FROM templates WHERE user_id = u.id) AS has_history
+                FROM users u
+                WHERE u.username = ?
+            ''', (username,)).fetchone()
+            return bool(row and row['has_history'])
+        except sqlite3.Error as e:
+            logger.error(f"Error checking history of user {username}: {str(e)}")
+            return False
+
     @staticmethod
     def delete(username):
         if username == 'admin':  # Prevent deletion of admin user
@@ -73,6 +93,10 @@ class User:
             db.execute('DELETE FROM users WHERE username = ?', (username,))
             db.commit()
             return True
+        except sqlite3.IntegrityError as e:
+            # With foreign keys enforced, users who have sent messages keep their history
+            logger.warning(f"Cannot delete user {username} with message history: {str(e)}")
+            return False
         except sqlite3.Error as e:
             logger.error(f"Error deleting user: {str(e)}")
             return False
@@ -103,39 +127,49 @@ class User:
             return []
 
 class Template:
+    # Templates as of cache_versions.version; shared by the request threads of one process
+    _cache_lock = threading.Lock()
+    _cache_version = None
+    _cache = ()
+
     @staticmethod
-    def get_all():
-        """Get all templates, ensuring only one Default template exists"""
+    def _cached():
+        """All templates ordered by title, reloaded only when another change bumped the version"""
         db = get_db()
+        row = db.execute("SELECT version FROM cache_versions WHERE name = 'templates'").fetchone()
+        version = row['version'] if row else None
+        with Template._cache_lock:
+            if version is not None and version == Template._cache_version:
+                return Template._cache
+        templates = tuple(db.execute('SELECT * FROM templates ORDER BY title').fetchall())
+        with Template._cache_lock:
+            Template._cache_version = version
+            Template._cache = templates
+        return templates
+
+    @staticmethod
+    def invalidate_cache():
+        """Drop this process's cached templates"""
+        with Template._cache_lock:
+            Template._cache_version = None
+            Template._cache = ()
+
+    @staticmethod
+    def get_all():
+        """Get all templates, from the in-process cache when it is current"""
         try:
-            # First, ensure only one Default template exists
-            default_templates = db.execute('SELECT COUNT(*) as count FROM templates WHERE title = "Default"').fetchone()['count']
-            if default_templates > 1:
-                # Keep the most recently updated Default template
-                db.execute('''
-                    DELETE FROM templates 
-                    WHERE title = "Default" 
-                    AND id NOT IN (
-                        SELECT id FROM templates 
-                        WHERE title = "Default" 
-                        ORDER BY COALESCE(updated_at, created_at) DESC 
-                        LIMIT 1
-                    )
-                ''')
-                db.commit()
-            
-            templates = db.execute('SELECT * FROM templates ORDER BY title').fetchall()
-            return templates
+            return list(Template._cached())
         except Exception as e:
             logger.error(f"Error getting templates: {str(e)}")
             return []
 
     @staticmethod
     def get_by_title(title):
-        db = get_db()
         try:
-            template = db.execute('SELECT * FROM templates WHERE title = ?', (title,)).fetchone()
-            return template
+            for template in Template._cached():
+                if template['title'] == title:
+                    return template
+            return None
         except Exception as e:
             logger.error(f"Error getting template by title: {str(e)}")
             return None
@@ -156,6 +190,7 @@ class Template:
                 VALUES (?, ?, ?, ?)
             ''', (title, content, now, now))
             db.commit()
+            Template.invalidate_cache()
             return True
         except sqlite3.IntegrityError:
             return False
@@ -174,6 +209,7 @@ class Template:
                 WHERE title = ?
             ''', (content, now, title))
             db.commit()
+            Template.invalidate_cache()
             return True
         except sqlite3.Error as e:
             logger.error(f"Error updating template: {str(e)}")
@@ -187,25 +223,220 @@ class Template:
         try:
             db.execute('DELETE FROM templates WHERE title = ?', (title,))
             db.commit()
+            Template.invalidate_cache()
             return True
         except sqlite3.Error as e:
             logger.error(f"Error deleting template: {str(e)}")
             return False
 
+def utc_timestamp():
+    """Current UTC time in the format SQLite's CURRENT_TIMESTAMP uses"""
+    return datetime.now(pytz.UTC).strftime('%Y-%m-%d %H:%M:%S')
+
+def local_date_to_utc(date_str, days=0):
+    """Convert a YYYY-MM-DD date in the app timezone to the UTC timestamp of its midnight"""
+    local_tz = pytz.timezone(Config.TIMEZONE)
+    day = datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=days)
+    return local_tz.localize(day).astimezone(pytz.UTC).strftime('%Y-%m-%d %H:%M:%S')
+
+def local_datetime_to_utc(datetime_str):
+    """Convert a YYYY-MM-DDTHH:MM time in the app timezone (as sent by datetime-local inputs) to a UTC timestamp"""
+    local_tz = pytz.timezone(Config.TIMEZONE)
+    moment = datetime.strptime(datetime_str, '%Y-%m-%dT%H:%M')
+    return local_tz.localize(moment).astimezone(pytz.UTC).strftime('%Y-%m-%d %H:%M:%S')
+
 class Message:
+    STATUSES = ('scheduled', 'queued', 'sending', 'sent', 'delivered', 'failed', 'dead')
+
+    @staticmethod
+    def build_filters(filters):
+        """Build a WHERE clause for report filters.
+
+        Supported keys are phone_number, status, sender_id, start_date and
+        end_date (inclusive local dates). Date bounds are converted to UTC so
+        the range is answered from the created_at indexes.
+        """
+        conditions = []
+        params = []
+        filters = filters or {}
+        if filters.get('phone_number'):
+            conditions.append('m.phone_number = ?')
+            params.append(filters['phone_number'])
+        if filters.get('status'):
+            conditions.append('m.status = ?')
+            params.append(filters['status'])
+        if filters.get('sender_id'):
+            conditions.append('m.sender_id = ?')
+            params.append(filters['sender_id'])
+        if filters.get('start_date'):
+            conditions.append('m.created_at >= ?')
+            params.append(local_date_to_utc(filters['start_date']))
+        if filters.get('end_date'):
+            conditions.append('m.created_at < ?')
+            params.append(local_date_to_utc(filters['end_date'], days=1))
+        return conditions, params
+
     @staticmethod
-    def create(phone_number, content, sender_id):
+    def create(phone_number, content, sender_id, scheduled_at=None):
+        """Queue a message, or hold it as 'scheduled' until ``scheduled_at`` (UTC)"""
         db = get_db()
         try:
             cursor = db.execute('''
-                INSERT INTO messages (phone_number, content, sender_id, status, queued_at) 
-                VALUES (?, ?, ?, 'queued', CURRENT_TIMESTAMP)
-            ''', (phone_number, content, sender_id))
+                INSERT INTO messages (phone_number, content, sender_id, status, queued_at, scheduled_at, segments) 
+                VALUES (?, ?, ?, ?, CASE WHEN ? IS NULL THEN CURRENT_TIMESTAMP END, ?, ?)
+            ''', (phone_number, content, sender_id, 'scheduled' if scheduled_at else 'queued',
+                  scheduled_at, scheduled_at, count_segments(content)))
             db.commit()
             return cursor.lastrowid
         except sqlite3.Error:
             return None
 
+    @staticmethod
+    def claim_next_queued(modem_id=None, lease=None, exclude_numbers=None):
+        """Atomically move the oldest queued message to 'sending' on a modem and return it.
+
+        A message waiting to be retried has its queued_at in the future, so it
+        is skipped until then without leaving the status index; so is any
+        message to one of ``exclude_numbers``. The claim holds a lease of
+        ``lease`` seconds that the worker must keep renewing.
+        """
+        lease = Config.SEND_LEASE_TIMEOUT if lease is None else lease
+        db = get_db()
+        try:
+            message = db.execute('''
+                UPDATE messages
+                SET status = 'sending', sending_at = CURRENT_TIMESTAMP, modem_id = ?,
+                    lease_expires_at = datetime('now', ?)
+                WHERE id = (
+                    SELECT id FROM messages
+                    WHERE status = 'queued' AND queued_at <= CURRENT_TIMESTAMP
+                      AND phone_number NOT IN (SELECT value FROM json_each(?))
+                    ORDER BY queued_at, id
+                    LIMIT 1
+                )
+                RETURNING *
+            ''', (modem_id, f"+{lease:.0f} seconds", json.dumps(list(exclude_numbers or ())))).fetchone()
+            db.commit()
+            return message
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error claiming next queued message: {str(e)}")
+            return None
+
+    @staticmethod
+    def release_due():
+        """Move scheduled messages whose time has come into the queue; returns how many"""
+        db = get_db()
+        try:
+            cursor = db.execute('''
+                UPDATE messages
+                SET status = 'queued', queued_at = CURRENT_TIMESTAMP
+                WHERE status = 'scheduled' AND scheduled_at <= CURRENT_TIMESTAMP
+            ''')
+            db.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error releasing scheduled messages: {str(e)}")
+            return 0
+
+    @staticmethod
+    def seconds_until_next_scheduled():
+        """Seconds until the earliest scheduled message is due (negative if overdue), or None"""
+        db = get_db()
+        try:
+            # MIN over the (status, scheduled_at) index is a single seek
+            row = db.execute('''
+                SELECT (julianday(MIN(scheduled_at)) - julianday('now')) * 86400 as wait
+                FROM messages
+                WHERE status = 'scheduled'
+            ''').fetchone()
+            return row['wait']
+        except sqlite3.Error as e:
+            logger.error(f"Error getting next scheduled message: {str(e)}")
+            return None
+
+    @staticmethod
+    def seconds_until_next_retry():
+        """Seconds until the earliest message deferred by a retry backoff becomes claimable, or None"""
+        db = get_db()
+        try:
+            # A range seek on the (status, queued_at) index
+            row = db.execute('''
+                SELECT (julianday(MIN(queued_at)) - julianday('now')) * 86400 as wait
+                FROM messages
+                WHERE status = 'queued' AND queued_at > CURRENT_TIMESTAMP
+            ''').fetchone()
+            return row['wait']
+        except sqlite3.Error as e:
+            logger.error(f"Error getting next retry: {str(e)}")
+            return None
+
+    @staticmethod
+    def renew_leases(message_ids, lease=None):
+        """Extend the lease on messages a worker still holds"""
+        if not message_ids:
+            return True
+        lease = Config.SEND_LEASE_TIMEOUT if lease is None else lease
+        db = get_db()
+        try:
+            placeholders = ','.join('?' * len(message_ids))
+            db.execute(f'''
+                UPDATE messages
+                SET lease_expires_at = datetime('now', ?)
+                WHERE id IN ({placeholders}) AND status = 'sending'
+            ''', (f"+{lease:.0f} seconds", *message_ids))
+            db.commit()
+            return True
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error renewing message leases: {str(e)}")
+            return False
+
+    @staticmethod
+    def recover_stale(policy='requeue', max_attempts=None):
+        """Reconcile 'sending' rows whose lease has expired.
+
+        Such a row was claimed by a process that died before recording the
+        outcome, so the SMS may or may not have gone out. 'requeue' counts
+        the interrupted attempt and queues the message again (at-least-once),
+        or moves it to 'dead' once it has used up its attempts; 'fail' marks
+        it failed so it is never sent twice. Returns the number recovered,
+        or None on error.
+        """
+        max_attempts = Config.SEND_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        db = get_db()
+        try:
+            stale = "status = 'sending' AND lease_expires_at < CURRENT_TIMESTAMP"
+            if policy == 'requeue':
+                dead = db.execute(f'''
+                    UPDATE messages
+                    SET status = 'dead', failed_at = CURRENT_TIMESTAMP, attempts = attempts + 1,
+                        lease_expires_at = NULL,
+                        error_message = 'Send interrupted ' || (attempts + 1) || ' times, giving up'
+                    WHERE {stale} AND attempts + 1 >= ?
+                ''', (max_attempts,)).rowcount
+                requeued = db.execute(f'''
+                    UPDATE messages
+                    SET status = 'queued', queued_at = CURRENT_TIMESTAMP, attempts = attempts + 1,
+                        lease_expires_at = NULL, error_message = 'Requeued after an interrupted send'
+                    WHERE {stale}
+                ''').rowcount
+                recovered = dead + requeued
+            else:
+                recovered = db.execute(f'''
+                    UPDATE messages
+                    SET status = 'failed', failed_at = CURRENT_TIMESTAMP, lease_expires_at = NULL,
+                        error_message = 'Send interrupted; the message may not have been sent'
+                    WHERE {stale}
+                ''').rowcount
+            db.commit()
+            return recovered
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error recovering stale messages: {str(e)}")
+            return None
+
     @staticmethod
     def get_all(page=1, per_page=25, phone_filter=None):
         """Get all messages with pagination and optional phone filter"""
@@ -216,11 +447,12 @@ class Message:
                 messages = db.execute('''
                     SELECT m.*, u.username as sender_name,
                            CASE 
+                               WHEN m.status = 'scheduled' THEN m.scheduled_at
                                WHEN m.status = 'queued' THEN m.queued_at
                                WHEN m.status = 'sending' THEN m.sending_at
                                WHEN m.status = 'sent' THEN m.sent_at
                                WHEN m.status = 'delivered' THEN m.delivered_at
-                               WHEN m.status = 'failed' THEN m.failed_at
+                               WHEN m.status IN ('failed', 'dead') THEN m.failed_at
                                ELSE m.created_at
                            END as status_time
                     FROM messages m 
@@ -233,11 +465,12 @@ class Message:
                 messages = db.execute('''
                     SELECT m.*, u.username as sender_name,
                            CASE 
+                               WHEN m.status = 'scheduled' THEN m.scheduled_at
                                WHEN m.status = 'queued' THEN m.queued_at
                                WHEN m.status = 'sending' THEN m.sending_at
                                WHEN m.status = 'sent' THEN m.sent_at
                                WHEN m.status = 'delivered' THEN m.delivered_at
-                               WHEN m.status = 'failed' THEN m.failed_at
+                               WHEN m.status IN ('failed', 'dead') THEN m.failed_at
                                ELSE m.created_at
                            END as status_time
                     FROM messages m 
@@ -250,6 +483,154 @@ class Message:
             logger.error(f"Error getting messages: {str(e)}")
             return []
 
+    @staticmethod
+    def encode_cursor(message):
+        """Encode a report row's (created_at, id) sort key as an opaque page token"""
+        raw = f"{message['sort_created_at']}|{message['id']}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(token):
+        """Decode a page token back into a (created_at, id) sort key"""
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            created_at, message_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+            return created_at, int(message_id)
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    @staticmethod
+    def get_page(per_page=25, cursor=None, direction='next', filters=None):
+        """Get one report page using keyset pagination on (created_at, id).
+
+        Returns the rows newest first, plus tokens for the next (older) and
+        previous (newer) pages, or None where there is no such page.
+        """
+        db = get_db()
+        key = Message.decode_cursor(cursor) if cursor else None
+        backwards = key is not None and direction == 'prev'
+
+        conditions, params = Message.build_filters(filters)
+        if key:
+            conditions.append('(m.created_at, m.id) > (?, ?)' if backwards else '(m.created_at, m.id) < (?, ?)')
+            params.extend(key)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = 'ASC' if backwards else 'DESC'
+
+        try:
+            rows = db.execute(f'''
+                SELECT m.*, u.username as sender_name,
+                       CAST(m.created_at AS TEXT) as sort_created_at,
+                       CASE 
+                           WHEN m.status = 'scheduled' THEN m.scheduled_at
+                           WHEN m.status = 'queued' THEN m.queued_at
+                           WHEN m.status = 'sending' THEN m.sending_at
+                           WHEN m.status = 'sent' THEN m.sent_at
+                           WHEN m.status = 'delivered' THEN m.delivered_at
+                           WHEN m.status IN ('failed', 'dead') THEN m.failed_at
+                           ELSE m.created_at
+                       END as status_time
+                FROM messages m 
+                JOIN users u ON m.sender_id = u.id 
+                {where}
+                ORDER BY m.created_at {order}, m.id {order}
+                LIMIT ?
+            ''', (*params, per_page + 1)).fetchall()
+        except Exception as e:
+            logger.error(f"Error getting message page: {str(e)}")
+            return {'messages': [], 'next_cursor': None, 'prev_cursor': None}
+
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return {'messages': [], 'next_cursor': None, 'prev_cursor': None}
+
+        if backwards:
+            next_cursor = Message.encode_cursor(rows[-1])
+            prev_cursor = Message.encode_cursor(rows[0]) if has_more else None
+        else:
+            next_cursor = Message.encode_cursor(rows[-1]) if has_more else None
+            prev_cursor = Message.encode_cursor(rows[0]) if key else None
+
+        return {'messages': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+    @staticmethod
+    def get_total_count(filters=None):
+        """Get the number of matching messages, from the maintained counter when unfiltered"""
+        db = get_db()
+        try:
+            conditions, params = Message.build_filters(filters)
+            if conditions:
+                return db.execute(
+                    f"SELECT COUNT(*) as total FROM messages m WHERE {' AND '.join(conditions)}",
+                    params
+                ).fetchone()['total']
+            row = db.execute("SELECT row_count FROM row_counts WHERE table_name = 'messages'").fetchone()
+            if row:
+                return row['row_count']
+            return db.execute('SELECT COUNT(*) as total FROM messages').fetchone()['total']
+        except Exception as e:
+            logger.error(f"Error getting message count: {str(e)}")
+            return 0
+
+    # Export column name and the expression that selects it; the SELECT and
+    # the header row are both built from this, so they always agree
+    EXPORT_FIELDS = (
+        ('id', 'm.id'),
+        ('created_at', 'CAST(m.created_at AS TEXT)'),
+        ('phone_number', 'm.phone_number'),
+        ('sender_name', 'u.username'),
+        ('status', 'm.status'),
+        ('scheduled_at', 'CAST(m.scheduled_at AS TEXT)'),
+        ('queued_at', 'CAST(m.queued_at AS TEXT)'),
+        ('sending_at', 'CAST(m.sending_at AS TEXT)'),
+        ('sent_at', 'CAST(m.sent_at AS TEXT)'),
+        ('delivered_at', 'CAST(m.delivered_at AS TEXT)'),
+        ('failed_at', 'CAST(m.failed_at AS TEXT)'),
+        ('error_message', 'm.error_message'),
+        ('batch_id', 'm.batch_id'),
+        ('segments', 'm.segments'),
+        ('attempts', 'm.attempts'),
+        ('content', 'm.content'),
+    )
+    EXPORT_COLUMNS = tuple(column for column, _ in EXPORT_FIELDS)
+
+    @staticmethod
+    def iter_export(filters=None, chunk_size=1000):
+        """Yield matching messages oldest first, one keyset chunk at a time.
+
+        Each chunk is a separate short query, so memory stays constant and no
+        read transaction is held open for the length of the export.
+        """
+        db = get_db()
+        conditions, params = Message.build_filters(filters)
+        select = ', '.join(f'{expression} as {column}' for column, expression in Message.EXPORT_FIELDS)
+        last_key = None
+        while True:
+            chunk_conditions = list(conditions)
+            chunk_params = list(params)
+            if last_key:
+                chunk_conditions.append('(m.created_at, m.id) > (?, ?)')
+                chunk_params.extend(last_key)
+            where = f"WHERE {' AND '.join(chunk_conditions)}" if chunk_conditions else ''
+            rows = db.execute(f'''
+                SELECT {select}
+                FROM messages m
+                LEFT JOIN users u ON m.sender_id = u.id
+                {where}
+                ORDER BY m.created_at, m.id
+                LIMIT ?
+            ''', (*chunk_params, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            last_key = (rows[-1]['created_at'], rows[-1]['id'])
+
     @staticmethod
     def get_by_phone(phone_number, limit=25, offset=0):
         db = get_db()
@@ -276,7 +657,8 @@ class Message:
                 'sending': 'sending_at',
                 'sent': 'sent_at',
                 'delivered': 'delivered_at',
-                'failed': 'failed_at'
+                'failed': 'failed_at',
+                'dead': 'failed_at'
             }.get(status)
             
             if timestamp_field:
@@ -298,6 +680,122 @@ class Message:
         except sqlite3.Error:
             return False
 
+    @staticmethod
+    def sent_update(message_id, references=None, modem_id=None, at=None):
+        """A 'sent' transition for apply_status_updates; ``at`` (UTC) defaults to now"""
+        return {'kind': 'sent', 'message_id': message_id, 'references': references or [],
+                'modem_id': modem_id, 'at': at or utc_timestamp()}
+
+    @staticmethod
+    def failure_update(message_id, status, error_message, retry_in=None, at=None):
+        """A failed-attempt transition for apply_status_updates; ``at`` (UTC) defaults to now"""
+        return {'kind': 'failure', 'message_id': message_id, 'status': status,
+                'error_message': error_message, 'retry_in': retry_in, 'at': at or utc_timestamp()}
+
+    @staticmethod
+    def partial_update(message_id, references, modem_id, error_message, at=None):
+        """A partly sent multipart message for apply_status_updates; ``at`` (UTC) defaults to now"""
+        return {'kind': 'partial', 'message_id': message_id, 'references': references or [],
+                'modem_id': modem_id, 'error_message': error_message, 'at': at or utc_timestamp()}
+
+    @staticmethod
+    def apply_status_updates(updates):
+        """Write a batch of send outcomes in one transaction.
+
+        'sent' updates store the parts' TP references and mark the message
+        sent. 'partial' updates store the references of the parts that did go
+        out and mark the message failed for good. Failure updates count the
+        attempt and either requeue the
+        message ``retry_in`` seconds after it failed or leave it in
+        ``status`` ('failed' for permanent errors, 'dead' once retries are
+        used up). Timestamps are when each outcome happened, not when the
+        batch is written.
+        """
+        sent = [update for update in updates if update['kind'] == 'sent']
+        partial = [update for update in updates if update['kind'] == 'partial']
+        failures = [update for update in updates if update['kind'] == 'failure']
+        db = get_db()
+        try:
+            db.executemany('''
+                INSERT INTO message_references (message_id, modem_id, part, reference)
+                VALUES (?, ?, ?, ?)
+            ''', [(update['message_id'], update['modem_id'], part, reference)
+                  for update in sent + partial
+                  for part, reference in enumerate(update['references'], 1) if reference is not None])
+            db.executemany('''
+                UPDATE messages
+                SET status = 'sent', sent_at = ?, error_message = NULL,
+                    attempts = attempts + 1
+                WHERE id = ?
+            ''', [(update['at'], update['message_id']) for update in sent])
+            db.executemany('''
+                UPDATE messages
+                SET status = 'failed', sent_at = ?, failed_at = ?,
+                    attempts = attempts + 1, error_message = ?
+                WHERE id = ?
+            ''', [(update['at'], update['at'], update['error_message'], update['message_id']) for update in partial])
+            db.executemany('''
+                UPDATE messages
+                SET status = 'queued', queued_at = datetime(?, ?),
+                    attempts = attempts + 1, error_message = ?
+                WHERE id = ?
+            ''', [(update['at'], f"+{update['retry_in']:.0f} seconds", update['error_message'], update['message_id'])
+                  for update in failures if update['retry_in'] is not None])
+            db.executemany('''
+                UPDATE messages
+                SET status = ?, failed_at = ?,
+                    attempts = attempts + 1, error_message = ?
+                WHERE id = ?
+            ''', [(update['status'], update['at'], update['error_message'], update['message_id'])
+                  for update in failures if update['retry_in'] is None])
+            db.commit()
+            return True
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error writing {len(updates)} status updates: {str(e)}")
+            return False
+
+    @staticmethod
+    def mark_sent(message_id, references=None, modem_id=None):
+        """Mark a message sent and store its parts' TP references in one transaction"""
+        return Message.apply_status_updates([Message.sent_update(message_id, references, modem_id)])
+
+    @staticmethod
+    def record_partial(message_id, references, modem_id, error_message):
+        """Store the references of the parts that went out and fail the message without retrying"""
+        return Message.apply_status_updates([Message.partial_update(message_id, references, modem_id, error_message)])
+
+    @staticmethod
+    def record_failure(message_id, status, error_message, retry_in=None):
+        """Count a failed attempt and either mark the message or requeue it.
+
+        With ``retry_in`` the message goes back to 'queued' and becomes
+        claimable that many seconds from now; otherwise it ends in ``status``
+        ('failed' for permanent errors, 'dead' once retries are used up).
+        """
+        return Message.apply_status_updates([Message.failure_update(message_id, status, error_message, retry_in)])
+
+    @staticmethod
+    def requeue_dead(filters=None):
+        """Put every dead message matching the report filters back in the queue; returns how many"""
+        filters = dict(filters or {})
+        filters['status'] = 'dead'
+        conditions, params = Message.build_filters(filters)
+        db = get_db()
+        try:
+            cursor = db.execute(f'''
+                UPDATE messages AS m
+                SET status = 'queued', queued_at = CURRENT_TIMESTAMP, attempts = 0,
+                    failed_at = NULL, error_message = NULL
+                WHERE {' AND '.join(conditions)}
+            ''', params)
+            db.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error requeuing dead messages: {str(e)}")
+            return None
+
     @staticmethod
     def delete(message_id):
         db = get_db()
@@ -309,29 +807,410 @@ class Message:
             return False
 
     @staticmethod
-    def delete_all():
+    def delete_all(chunk_size=None):
+        """Delete every message in short transactions so other writers are never locked out for long"""
+        chunk_size = chunk_size or Config.RETENTION_CHUNK_SIZE
         db = get_db()
         try:
-            db.execute('DELETE FROM messages')
+            while True:
+                deleted = db.execute('''
+                    DELETE FROM messages
+                    WHERE id IN (SELECT id FROM messages LIMIT ?)
+                ''', (chunk_size,)).rowcount
+                db.commit()
+                if deleted < chunk_size:
+                    return True
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error deleting messages: {str(e)}")
+            return False
+
+    # Only messages whose outcome is final are archived
+    FINAL_STATUSES = ('sent', 'delivered', 'failed', 'dead')
+
+    @staticmethod
+    def get_archivable(cutoff, limit):
+        """Oldest finished messages created before ``cutoff`` (UTC), in created_at order"""
+        db = get_db()
+        placeholders = ','.join('?' * len(Message.FINAL_STATUSES))
+        try:
+            return db.execute(f'''
+                SELECT * FROM messages
+                WHERE created_at < ? AND status IN ({placeholders})
+                ORDER BY created_at, id
+                LIMIT ?
+            ''', (cutoff, *Message.FINAL_STATUSES, limit)).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error getting messages to archive: {str(e)}")
+            return None
+
+    # The hour a message is counted under in message_stats, as the stats triggers work it out
+    STATS_HOUR_SQL = '''strftime('%Y-%m-%d %H:00:00', COALESCE(CASE status
+        WHEN 'queued' THEN queued_at
+        WHEN 'sending' THEN sending_at
+        WHEN 'sent' THEN sent_at
+        WHEN 'delivered' THEN delivered_at
+        WHEN 'failed' THEN failed_at
+        WHEN 'dead' THEN failed_at
+    END, created_at))'''
+
+    @staticmethod
+    def delete_many(message_ids, keep_stats=False):
+        """Delete a chunk of messages in one transaction.
+
+        With ``keep_stats`` the messages stay counted in message_stats, as
+        when they are archived rather than discarded: their counts are added
+        back first, cancelling out what the delete trigger takes off.
+        """
+        db = get_db()
+        try:
+            placeholders = ','.join('?' * len(message_ids))
+            if keep_stats:
+                db.execute(f'''
+                    INSERT INTO message_stats (hour, status, sender_id, count)
+                    SELECT {Message.STATS_HOUR_SQL}, status, sender_id, COUNT(*)
+                    FROM messages
+                    WHERE id IN ({placeholders})
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT (hour, status, sender_id) DO UPDATE SET count = count + excluded.count
+                ''', tuple(message_ids))
+            db.execute(f'DELETE FROM messages WHERE id IN ({placeholders})', tuple(message_ids))
             db.commit()
             return True
-        except sqlite3.Error:
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error deleting {len(message_ids)} messages: {str(e)}")
             return False
 
     @classmethod
     def get_total_pages(cls, per_page, phone_filter=None):
         """Get total number of pages for pagination"""
-        db = get_db()
         try:
-            if phone_filter:
-                count = db.execute(
-                    'SELECT COUNT(*) as total FROM messages WHERE phone_number = ?',
-                    (phone_filter,)
-                ).fetchone()['total']
-            else:
-                count = db.execute('SELECT COUNT(*) as total FROM messages').fetchone()['total']
-            
+            count = cls.get_total_count({'phone_number': phone_filter})
             return (count + per_page - 1) // per_page  # Ceiling division
         except Exception as e:
             logger.error(f"Error getting total pages: {str(e)}")
-            return 1  # Return at least 1 page on error 
\ No newline at end of file
+            return 1  # Return at least 1 page on error
+
+class MessageBatch:
+    @staticmethod
+    def create(messages, sender_id, scheduled_at=None):
+        """Create a batch and queue (or schedule) its messages in a single transaction.
+
+        ``messages`` are dicts with phone_number, content and segments, so
+        each recipient can get their own rendered text.
+        """
+        db = get_db()
+        try:
+            cursor = db.execute('''
+                INSERT INTO message_batches (sender_id, total)
+                VALUES (?, ?)
+            ''', (sender_id, len(messages)))
+            batch_id = cursor.lastrowid
+            status = 'scheduled' if scheduled_at else 'queued'
+            db.executemany('''
+                INSERT INTO messages (phone_number, content, sender_id, status, queued_at, scheduled_at,
+                                      batch_id, segments)
+                VALUES (?, ?, ?, ?, CASE WHEN ? IS NULL THEN CURRENT_TIMESTAMP END, ?, ?, ?)
+            ''', [(message['phone_number'], message['content'], sender_id, status, scheduled_at, scheduled_at,
+                   batch_id, message['segments']) for message in messages])
+            db.commit()
+            return batch_id
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error creating message batch: {str(e)}")
+            return None
+
+    @staticmethod
+    def get_status(batch_id, sender_id=None):
+        """Get a batch with its message counts per status"""
+        db = get_db()
+        try:
+            if sender_id is not None:
+                batch = db.execute('SELECT * FROM message_batches WHERE id = ? AND sender_id = ?',
+                                   (batch_id, sender_id)).fetchone()
+            else:
+                batch = db.execute('SELECT * FROM message_batches WHERE id = ?', (batch_id,)).fetchone()
+            if not batch:
+                return None
+
+            counts = db.execute('''
+                SELECT status, COUNT(*) as count
+                FROM messages
+                WHERE batch_id = ?
+                GROUP BY status
+            ''', (batch_id,)).fetchall()
+            return {
+                'id': batch['id'],
+                'total': batch['total'],
+                'created_at': batch['created_at'],
+                'statuses': {row['status']: row['count'] for row in counts}
+            }
+        except Exception as e:
+            logger.error(f"Error getting batch status: {str(e)}")
+            return None
+
+class MessageReference:
+    @staticmethod
+    def apply_reports(modem_id, reports):
+        """Match a batch of status reports to sent parts and update their messages.
+
+        Each report is a dict with ``reference``, ``status`` ('delivered' or
+        'failed') and ``delivery_status`` (the raw TP-Status). A message turns
+        'delivered' once every part is delivered, or 'failed' as soon as any
+        part fails. Returns the number of reports that matched a part, or
+        None if the batch could not be applied.
+        """
+        db = get_db()
+        try:
+            matched = 0
+            message_ids = set()
+            for report in reports:
+                # References wrap at 256, so match the newest unresolved one
+                row = db.execute('''
+                    UPDATE message_references
+                    SET status = ?, delivery_status = ?, reported_at = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM message_references
+                        WHERE modem_id = ? AND reference = ? AND status IS NULL
+                        ORDER BY id DESC
+                        LIMIT 1
+                    )
+                    RETURNING message_id
+                ''', (report['status'], report['delivery_status'], modem_id, report['reference'])).fetchone()
+                if row:
+                    matched += 1
+                    message_ids.add(row['message_id'])
+
+            if message_ids:
+                placeholders = ','.join('?' * len(message_ids))
+                db.execute(f'''
+                    UPDATE messages
+                    SET status = 'failed', failed_at = CURRENT_TIMESTAMP,
+                        error_message = printf('Delivery failed: status report 0x%02X', (
+                            SELECT r.delivery_status FROM message_references r
+                            WHERE r.message_id = messages.id AND r.status = 'failed'
+                            LIMIT 1
+                        ))
+                    WHERE id IN ({placeholders}) AND status = 'sent'
+                    AND EXISTS (
+                        SELECT 1 FROM message_references r
+                        WHERE r.message_id = messages.id AND r.status = 'failed'
+                    )
+                ''', tuple(message_ids))
+                db.execute(f'''
+                    UPDATE messages
+                    SET status = 'delivered', delivered_at = CURRENT_TIMESTAMP
+                    WHERE id IN ({placeholders}) AND status = 'sent'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM message_references r
+                        WHERE r.message_id = messages.id AND r.status IS NOT 'delivered'
+                    )
+                ''', tuple(message_ids))
+            db.commit()
+            return matched
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error applying status reports: {str(e)}")
+            return None
+
+class MessageStats:
+    # Statuses a message passes through before its outcome is known
+    IN_FLIGHT = ('scheduled', 'queued', 'sending')
+
+    @staticmethod
+    def get_summary(days=14):
+        """Per-day, per-status and per-sender counts from the message_stats rollup.
+
+        Every query reads at most ``days`` x 24 hours x statuses x senders
+        rollup rows, so the cost does not grow with the size of the messages
+        table. The rollup counts UTC hours; they are grouped here into dates
+        in the app timezone, like the report's date filters.
+        """
+        db = get_db()
+        local_tz = pytz.timezone(Config.TIMEZONE)
+        today = datetime.now(local_tz).date()
+        since = (today - timedelta(days=max(days, 1) - 1)).isoformat()
+        since_hour = local_date_to_utc(since)
+        try:
+            daily = {}
+            for row in db.execute('''
+                SELECT hour, status, SUM(count) as count
+                FROM message_stats
+                WHERE hour >= ?
+                GROUP BY hour, status
+                ORDER BY hour
+            ''', (since_hour,)):
+                moment = pytz.UTC.localize(datetime.strptime(row['hour'], '%Y-%m-%d %H:%M:%S'))
+                statuses = daily.setdefault(moment.astimezone(local_tz).date().isoformat(), {})
+                statuses[row['status']] = statuses.get(row['status'], 0) + row['count']
+
+            placeholders = ','.join('?' * len(MessageStats.IN_FLIGHT))
+            in_flight = {status: 0 for status in MessageStats.IN_FLIGHT}
+            for row in db.execute(f'''
+                SELECT status, SUM(count) as count
+                FROM message_stats
+                WHERE status IN ({placeholders})
+                GROUP BY status
+            ''', MessageStats.IN_FLIGHT):
+                in_flight[row['status']] = row['count']
+
+            senders = {}
+            for row in db.execute('''
+                SELECT s.sender_id, u.username, s.status, SUM(s.count) as count
+                FROM message_stats s
+                LEFT JOIN users u ON u.id = s.sender_id
+                WHERE s.hour >= ?
+                GROUP BY s.sender_id, s.status
+            ''', (since_hour,)):
+                sender = senders.setdefault(row['sender_id'], {
+                    'sender_id': row['sender_id'],
+                    'username': row['username'],
+                    'statuses': {}
+                })
+                sender['statuses'][row['status']] = row['count']
+
+            return {
+                'since': since,
+                'today': {'day': today.isoformat(), 'statuses': daily.get(today.isoformat(), {})},
+                'in_flight': in_flight,
+                'daily': [{'day': day, 'statuses': statuses} for day, statuses in daily.items()],
+                'senders': list(senders.values())
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Error getting message stats: {str(e)}")
+            return None
+
+class InboundMessage:
+    @staticmethod
+    def add_all(modem_id, messages):
+        """Store received messages in one transaction; returns how many, or None on error"""
+        db = get_db()
+        try:
+            db.executemany('''
+                INSERT INTO inbound_messages (modem_id, phone_number, content, parts, smsc_time)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(modem_id, message['phone_number'], message['content'], message['parts'], message['smsc_time'])
+                  for message in messages])
+            db.commit()
+            return len(messages)
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error storing inbound messages: {str(e)}")
+            return None
+
+    @staticmethod
+    def build_filters(filters):
+        """Build a WHERE clause for inbox search.
+
+        Supported keys are phone_number (matched in both 07... and +447...
+        form), q (text the message contains), start_date and end_date.
+        """
+        conditions = []
+        params = []
+        filters = filters or {}
+        phone_number = filters.get('phone_number')
+        if phone_number:
+            variants = {phone_number}
+            if phone_number.startswith('07'):
+                variants.add('+44' + phone_number[1:])
+            elif phone_number.startswith('+447'):
+                variants.add('0' + phone_number[3:])
+            conditions.append(f"i.phone_number IN ({','.join('?' * len(variants))})")
+            params.extend(sorted(variants))
+        if filters.get('q'):
+            conditions.append("i.content LIKE ? ESCAPE '\\'")
+            escaped = filters['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f"%{escaped}%")
+        if filters.get('start_date'):
+            conditions.append('i.received_at >= ?')
+            params.append(local_date_to_utc(filters['start_date']))
+        if filters.get('end_date'):
+            conditions.append('i.received_at < ?')
+            params.append(local_date_to_utc(filters['end_date'], days=1))
+        return conditions, params
+
+    @staticmethod
+    def get_total_count(filters=None):
+        """Get the number of matching received messages"""
+        db = get_db()
+        try:
+            conditions, params = InboundMessage.build_filters(filters)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            return db.execute(f'SELECT COUNT(*) as total FROM inbound_messages i {where}', params).fetchone()['total']
+        except Exception as e:
+            logger.error(f"Error getting inbox count: {str(e)}")
+            return 0
+
+    @staticmethod
+    def get_page(per_page=25, cursor=None, direction='next', filters=None):
+        """Get one inbox page, newest first, using keyset pagination on (received_at, id)"""
+        db = get_db()
+        key = Message.decode_cursor(cursor) if cursor else None
+        backwards = key is not None and direction == 'prev'
+
+        conditions, params = InboundMessage.build_filters(filters)
+        if key:
+            conditions.append('(i.received_at, i.id) > (?, ?)' if backwards else '(i.received_at, i.id) < (?, ?)')
+            params.extend(key)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = 'ASC' if backwards else 'DESC'
+
+        try:
+            rows = db.execute(f'''
+                SELECT i.*, CAST(i.received_at AS TEXT) as sort_created_at
+                FROM inbound_messages i
+                {where}
+                ORDER BY i.received_at {order}, i.id {order}
+                LIMIT ?
+            ''', (*params, per_page + 1)).fetchall()
+        except Exception as e:
+            logger.error(f"Error getting inbox page: {str(e)}")
+            return {'messages': [], 'next_cursor': None, 'prev_cursor': None}
+
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return {'messages': [], 'next_cursor': None, 'prev_cursor': None}
+
+        if backwards:
+            next_cursor = Message.encode_cursor(rows[-1])
+            prev_cursor = Message.encode_cursor(rows[0]) if has_more else None
+        else:
+            next_cursor = Message.encode_cursor(rows[-1]) if has_more else None
+            prev_cursor = Message.encode_cursor(rows[0]) if key else None
+
+        return {'messages': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+class ModemStatus:
+    @staticmethod
+    def save_all(statuses):
+        """Replace the published modem statuses with the given list, in pool order"""
+        db = get_db()
+        try:
+            db.execute('DELETE FROM modem_status')
+            db.executemany('''
+                INSERT INTO modem_status (modem_id, position, status)
+                VALUES (?, ?, ?)
+            ''', [(status['id'], position, json.dumps(status, default=str))
+                  for position, status in enumerate(statuses)])
+            db.commit()
+            return True
+        except sqlite3.Error as e:
+            db.rollback()
+            logger.error(f"Error saving modem status: {str(e)}")
+            return False
+
+    @staticmethod
+    def get_all():
+        """Get the published modem statuses, primary modem first"""
+        db = get_db()
+        try:
+            rows = db.execute('SELECT status FROM modem_status ORDER BY position').fetchall()
+            return [json.loads(row['status']) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting modem status: {str(e)}")
+            return []
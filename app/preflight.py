@@ -4,7 +4,9 @@ Preflight checks for SMS Tool
 """
 
 import os
+import re
 import sys
+import sqlite3
 import gammu
 import logging
 from .config import Config
@@ -74,6 +76,36 @@ def check_instance_dir():
         logger.error(f"❌ Cannot write to instance directory {instance_dir}: {e}")
         return False
 
+def check_database_schema():
+    """Report pending schema migrations for an existing database"""
+    db_path = Config.DATABASE
+    if not os.path.exists(db_path):
+        logger.info("✓ No existing database, it will be created at startup")
+        return True
+
+    migrations_dir = os.path.join(os.path.dirname(__file__), '..', 'database', 'migrations')
+    versions = [int(m.group(1)) for m in (re.match(r'^(\d+)_.*\.sql$', f) for f in os.listdir(migrations_dir)) if m] \
+        if os.path.isdir(migrations_dir) else []
+    latest = max(versions, default=0)
+
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"❌ Cannot read database {db_path}: {e}")
+        return False
+
+    if version < latest:
+        logger.info(f"✓ Database schema is at version {version}, migrations up to {latest} will be applied at startup")
+    elif version > latest:
+        logger.warning(f"Database schema version {version} is newer than this application ({latest})")
+    else:
+        logger.info(f"✓ Database schema is up to date (version {version})")
+    return True
+
 def main():
     """Run all preflight checks"""
     logger.info("Running preflight checks...")
@@ -81,7 +113,8 @@ def main():
     checks = [
         check_device_exists,
         check_gammu_config,
-        check_instance_dir
+        check_instance_dir,
+        check_database_schema
     ]
     
     all_passed = True
@@ -2,13 +2,19 @@
 Application routes
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app, g, Response, stream_with_context
 from functools import wraps
-from .models import User, Template, Message
-from .database import get_db
-from .services.gammu_service import GammuService
+from .models import (User, Template, Message, MessageBatch, MessageStats, ModemStatus, InboundMessage,
+                     local_datetime_to_utc)
+from .database import get_db, get_pool
+from .services.rate_limiter import get_rate_limiter
+from .sms_encoding import count_segments
+from .message_templates import compile_template, normalize_field, MissingFieldsError
 from .exceptions import GammuError, ModemError, SIMError, NetworkError, ErrorCode
 import re
+import csv
+import io
+import json
 import logging
 import time
 
@@ -20,39 +26,73 @@ user_bp = Blueprint('user', __name__)
 # Get logger
 logger = logging.getLogger('routes')
 
-# Initialize GammuService singleton
-gammu_service = GammuService()
+# Recipient parsing for bulk sends
+PHONE_NUMBER_PATTERN = re.compile(r'^07\d{9}$')
+RECIPIENT_SEPARATORS = re.compile(r'[\s,;]+')
 
-# Rate limiting configuration
-RATE_LIMIT_WINDOW = 60  # seconds
-RATE_LIMIT_MAX_REQUESTS = 30
-rate_limit_data = {
-    'requests': [],
-    'window_start': time.time()
-}
+def parse_recipients(text, csv_file=None):
+    """Collect unique recipients from pasted text and an optional CSV upload.
+
+    Returns ``(phone_number, fields)`` pairs. When the CSV has a header row,
+    its other columns become the recipient's template fields, keyed by the
+    normalised header ('First Name' -> first_name).
+    """
+    candidates = [(token, {}) for token in RECIPIENT_SEPARATORS.split(text or '') if token]
+
+    if csv_file and csv_file.filename:
+        reader = csv.reader(io.StringIO(csv_file.read().decode('utf-8-sig', errors='replace')))
+        rows = [row for row in reader if row]
+        column = 0
+        header = None
+        if rows:
+            names = [normalize_field(cell) for cell in rows[0]]
+            for name in ('phone_number', 'phone', 'number', 'mobile'):
+                if name in names:
+                    column = names.index(name)
+                    header = names
+                    rows = rows[1:]
+                    break
+        for row in rows:
+            if len(row) <= column:
+                continue
+            fields = {}
+            if header:
+                fields = {name: value.strip() for name, value in zip(header, row) if name}
+            candidates.append((row[column], fields))
+
+    recipients = []
+    seen = set()
+    for candidate, fields in candidates:
+        number = re.sub(r'[\s\-()]', '', candidate)
+        if number and number not in seen:
+            seen.add(number)
+            recipients.append((number, fields))
+    return recipients
+
+def parse_send_at(value):
+    """Turn an optional send time in the app timezone into a UTC timestamp.
+
+    Returns None to send now; raises ValueError for a malformed time or one
+    that has already passed (a few minutes of slack allow for form filling).
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        scheduled_at = local_datetime_to_utc(value)
+    except ValueError:
+        raise ValueError('Invalid send time.')
+    earliest = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - 300))
+    if scheduled_at < earliest:
+        raise ValueError('Send time is in the past.')
+    return scheduled_at
 
 def check_rate_limit():
-    """Check if request is within rate limits"""
-    current_time = time.time()
-    
-    # Clear old requests
-    rate_limit_data['requests'] = [
-        req_time for req_time in rate_limit_data['requests']
-        if current_time - req_time < RATE_LIMIT_WINDOW
-    ]
-    
-    # Check if window has expired
-    if current_time - rate_limit_data['window_start'] >= RATE_LIMIT_WINDOW:
-        rate_limit_data['window_start'] = current_time
-        rate_limit_data['requests'] = []
-    
-    # Check if limit exceeded
-    if len(rate_limit_data['requests']) >= RATE_LIMIT_MAX_REQUESTS:
-        return False
-    
-    # Add current request
-    rate_limit_data['requests'].append(current_time)
-    return True
+    """Check if request is within the per-user and per-address rate limits"""
+    limits = [(f"ip:{request.remote_addr}", current_app.config['RATE_LIMIT_IP_MAX_REQUESTS'])]
+    if 'user_id' in session:
+        limits.append((f"user:{session['user_id']}", current_app.config['RATE_LIMIT_MAX_REQUESTS']))
+    return get_rate_limiter().allow(limits)
 
 def standardize_health_response(status: str, components: dict = None, error: str = None) -> tuple:
     """Create standardized health check response"""
@@ -83,38 +123,42 @@ def register_health_check(app):
                 logger.error(f"Database health check failed: {str(e)}")
                 db_status = 'unhealthy'
             
-            # Check modem
-            try:
-                modem_info = gammu_service.get_modem_info()
-                modem_status = 'healthy' if modem_info else 'degraded'
+            # Modem, SIM and network state come from the pollers' cached snapshots,
+            # so this endpoint never waits on the serial port. Processes that do
+            # not own the modems report what the owner last published.
+            modems = g.modem_pool.stats() if g.modem_pool else ModemStatus.get_all()
+            primary = modems[0] if modems else {}
+            snapshot = primary.get('health')
+            modem_info = None
+            sim_info = None
+            network_info = None
+            if snapshot and snapshot['updated_at']:
+                modem = snapshot['modem'] or {}
+                device = snapshot['device'] or {}
+                modem_status = 'healthy' if modem.get('signal') else 'degraded'
                 
                 # Simplify modem info and extract only SIM7600E-H from the model string
-                if modem_info:
-                    model = modem_info.get('model', '')
-                    # Extract just the SIM7600E-H part from the model string
-                    if 'SIM7600E-H' in model:
-                        model = 'SIM7600E-H'
-                    elif 'SIMCOM_SIM7600E-H' in model:
-                        model = 'SIM7600E-H'
-                    # Remove any "unknown," prefix
-                    model = model.replace('unknown,', '').strip()
-                    modem_info = {
-                        'signal': modem_info.get('signal', {}).get('SignalPercent'),
-                        'model': model
-                    }
-            except Exception as e:
-                logger.error(f"Modem health check failed: {str(e)}")
-                modem_status = 'degraded'
-                modem_info = None
-            
-            # Check SIM
-            try:
-                sim_info = gammu_service.get_sim_status()
+                model = device.get('model') or ''
+                if isinstance(model, (tuple, list)):
+                    model = ','.join(str(part) for part in model if part)
+                # Extract just the SIM7600E-H part from the model string
+                if 'SIM7600E-H' in model:
+                    model = 'SIM7600E-H'
+                # Remove any "unknown," prefix
+                model = model.replace('unknown,', '').strip()
+                modem_info = {
+                    'signal': (modem.get('signal') or {}).get('SignalPercent'),
+                    'model': model
+                }
+                
+                sim_info = snapshot['sim']
                 sim_status = 'healthy' if sim_info and sim_info.get('status') == 'ready' else 'degraded'
-            except Exception as e:
-                logger.error(f"SIM health check failed: {str(e)}")
-                sim_status = 'degraded'
-                sim_info = None
+                
+                network_info = snapshot['network']
+                network_status = 'healthy' if network_info and network_info.get('State') in ('HomeNetwork', 'RoamingNetwork') else 'degraded'
+            else:
+                modem_status = sim_status = network_status = 'degraded'
+            snapshot_age = round(time.time() - snapshot['updated_at'], 1) if snapshot and snapshot['updated_at'] else None
             
             # Overall health is healthy if database is working
             # We don't make the container unhealthy for modem, SIM or network issues
@@ -124,17 +168,25 @@ def register_health_check(app):
                 'status': status,
                 'components': {
                     'database': {
-                        'status': db_status
+                        'status': db_status,
+                        'pool': get_pool().stats()
                     },
                     'modem': {
                         'status': modem_status,
-                        'info': modem_info
+                        'info': modem_info,
+                        'send_latency': primary.get('send_latency')
                     },
+                    'modems': [{key: value for key, value in modem.items() if key != 'health'} for modem in modems],
                     'sim': {
                         'status': sim_status,
                         'info': sim_info
+                    },
+                    'network': {
+                        'status': network_status,
+                        'info': network_info
                     }
-                }
+                },
+                'snapshot_age': snapshot_age
             }
             
             return jsonify(response), 200 if status == 'healthy' else 500
@@ -244,6 +296,12 @@ def delete_user():
             flash('Cannot delete admin user', 'error')
             return redirect(url_for('admin.delete_user'))
         
+        # Foreign keys keep every message attributed to the user who sent it
+        if User.has_history(username):
+            flash(f'{username} has sent messages or saved templates and cannot be deleted, '
+                  f'so that their history stays attributed to them.', 'warning')
+            return redirect(url_for('admin.delete_user'))
+        
         if User.delete(username):
             flash('User deleted successfully', 'success')
             return redirect(url_for('admin.manage_users'))
@@ -343,22 +401,48 @@ def manage_templates():
     
     return render_template('manage_templates.html', templates=templates)
 
+def get_report_filters():
+    """Read the SMS report filters from the query string, dropping invalid values"""
+    filter_args = {}
+    for name in ('start_date', 'end_date'):
+        value = request.args.get(name)
+        if value:
+            try:
+                time.strptime(value, '%Y-%m-%d')
+                filter_args[name] = value
+            except ValueError:
+                logger.warning(f"Ignoring invalid {name}: {value}")
+    status = request.args.get('status')
+    if status in Message.STATUSES:
+        filter_args['status'] = status
+    phone_number = request.args.get('phone_number', '').strip()
+    if phone_number:
+        filter_args['phone_number'] = phone_number
+    sender = request.args.get('sender', '').strip()
+    if sender:
+        filter_args['sender'] = sender
+    return filter_args
+
 @admin_bp.route('/report')
 @admin_required
 def sms_report():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    direction = request.args.get('dir', 'next')
     per_page = request.args.get('per_page', 25, type=int)
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
+    filter_args = get_report_filters()
     today = time.strftime('%Y-%m-%d')
     
     try:
-        messages = Message.get_all(page, per_page)
-        total_pages = Message.get_total_pages(per_page)
+        filters = dict(filter_args)
+        if filters.get('sender'):
+            sender = User.get_by_username(filters.pop('sender'))
+            filters['sender_id'] = sender['id'] if sender else -1
+        page = Message.get_page(per_page, cursor, direction, filters)
+        total = Message.get_total_count(filters)
         
         # Convert messages to the format expected by the template
         reports = []
-        for msg in messages:
+        for msg in page['messages']:
             reports.append({
                 'id': msg['id'],
                 'date': msg['status_time'],
@@ -370,16 +454,71 @@ def sms_report():
         
         return render_template('sms_report.html',
                              reports=reports,
-                             page=page,
-                             total_pages=total_pages,
-                             start_date=start_date,
-                             end_date=end_date,
+                             next_cursor=page['next_cursor'],
+                             prev_cursor=page['prev_cursor'],
+                             per_page=per_page,
+                             total=total,
+                             filter_args=filter_args,
+                             statuses=Message.STATUSES,
+                             users=User.get_all(),
+                             start_date=filter_args.get('start_date'),
+                             end_date=filter_args.get('end_date'),
                              today=today)
     except Exception as e:
         logger.error(f"Error in SMS report: {str(e)}")
         flash('Error loading SMS report', 'error')
         return redirect(url_for('admin.dashboard'))
 
+@admin_bp.route('/report/export')
+@admin_required
+def export_messages():
+    """Stream message history as CSV or NDJSON, honouring the report filters"""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Unsupported export format'}), 400
+
+    filters = get_report_filters()
+    if filters.get('sender'):
+        sender = User.get_by_username(filters.pop('sender'))
+        filters['sender_id'] = sender['id'] if sender else -1
+    columns = Message.EXPORT_COLUMNS
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for count, row in enumerate(Message.iter_export(filters), 1):
+            writer.writerow([row[column] for column in columns])
+            if count % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_ndjson():
+        for row in Message.iter_export(filters):
+            yield json.dumps({column: row[column] for column in columns}) + '\n'
+
+    filename = f"sms-export-{time.strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    logger.info(f"Starting {export_format} export with filters {filters}")
+    if export_format == 'csv':
+        generator, mimetype = generate_csv(), 'text/csv'
+    else:
+        generator, mimetype = generate_ndjson(), 'application/x-ndjson'
+    return Response(stream_with_context(generator),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@admin_bp.route('/stats')
+@admin_required
+def message_stats():
+    """Message counts per day, status and sender for dashboard charts"""
+    days = min(max(request.args.get('days', 14, type=int), 1), 366)
+    stats = MessageStats.get_summary(days)
+    if stats is None:
+        return jsonify({'error': 'Statistics unavailable'}), 500
+    return jsonify(stats)
+
 @admin_bp.route('/report/delete/<int:message_id>', methods=['POST'])
 @admin_required
 def delete_message(message_id):
@@ -389,6 +528,24 @@ def delete_message(message_id):
         flash('Failed to delete message', 'error')
     return redirect(url_for('admin.sms_report'))
 
+@admin_bp.route('/report/requeue-dead', methods=['POST'])
+@admin_required
+def requeue_dead_messages():
+    """Send dead messages matching the report filters through the queue again"""
+    filters = get_report_filters()
+    filters.pop('status', None)
+    if filters.get('sender'):
+        sender = User.get_by_username(filters.pop('sender'))
+        filters['sender_id'] = sender['id'] if sender else -1
+    count = Message.requeue_dead(filters)
+    if count is None:
+        flash('Failed to requeue messages', 'error')
+    else:
+        if count and g.sms_dispatcher:
+            g.sms_dispatcher.notify()
+        flash(f'Requeued {count} dead message{"" if count == 1 else "s"}', 'success')
+    return redirect(url_for('admin.sms_report', **get_report_filters()))
+
 @admin_bp.route('/report/delete-all', methods=['POST'])
 @admin_required
 def delete_all_messages():
@@ -398,6 +555,49 @@ def delete_all_messages():
         flash('Failed to delete messages', 'error')
     return redirect(url_for('admin.sms_report'))
 
+def get_inbox_filters():
+    """Read the inbox search filters from the query string, dropping invalid values"""
+    filter_args = {}
+    for name in ('start_date', 'end_date'):
+        value = request.args.get(name)
+        if value:
+            try:
+                time.strptime(value, '%Y-%m-%d')
+                filter_args[name] = value
+            except ValueError:
+                logger.warning(f"Ignoring invalid {name}: {value}")
+    for name in ('phone_number', 'q'):
+        value = request.args.get(name, '').strip()
+        if value:
+            filter_args[name] = value
+    return filter_args
+
+@admin_bp.route('/inbox')
+@admin_required
+def inbox():
+    """Search messages received on the modems"""
+    cursor = request.args.get('cursor')
+    direction = request.args.get('dir', 'next')
+    per_page = request.args.get('per_page', 25, type=int)
+    filter_args = get_inbox_filters()
+
+    try:
+        page = InboundMessage.get_page(per_page, cursor, direction, filter_args)
+        return render_template('inbox.html',
+                             messages=page['messages'],
+                             next_cursor=page['next_cursor'],
+                             prev_cursor=page['prev_cursor'],
+                             per_page=per_page,
+                             total=InboundMessage.get_total_count(filter_args),
+                             filter_args=filter_args,
+                             start_date=filter_args.get('start_date'),
+                             end_date=filter_args.get('end_date'),
+                             today=time.strftime('%Y-%m-%d'))
+    except Exception as e:
+        logger.error(f"Error in inbox: {str(e)}")
+        flash('Error loading inbox', 'error')
+        return redirect(url_for('admin.dashboard'))
+
 # User routes
 @user_bp.route('/')
 @login_required
@@ -415,7 +615,7 @@ def dashboard():
 @user_bp.route('/send-sms', methods=['POST'])
 @login_required
 def send_sms():
-    """Send SMS message"""
+    """Queue SMS message for the dispatch worker"""
     logger.info("Starting SMS send process")
     
     if not check_rate_limit():
@@ -424,80 +624,65 @@ def send_sms():
         return redirect(url_for('user.dashboard'))
 
     phone_number = request.form.get('phone_number')
-    message = request.form.get('message')
+    message = request.form.get('message', '')
     
     logger.info(f"Attempting to send SMS to {phone_number}")
     
     # Validate phone number
-    if not re.match(r'^07\d{9}$', phone_number):
+    if not PHONE_NUMBER_PATTERN.match(phone_number or ''):
         logger.warning(f"Invalid phone number format: {phone_number}")
         flash('Invalid phone number. Must start with 07 and be 11 digits long.', 'error')
         return redirect(url_for('user.dashboard'))
     
+    if not message.strip():
+        logger.warning("Empty message")
+        flash('Message cannot be empty.', 'error')
+        return redirect(url_for('user.dashboard'))
+    
     # Check for repeated characters, excluding template placeholders (X's)
     if re.search(r'([^X])\1{3,}', message):
         logger.warning("Message contains too many repeated characters")
         flash('Message contains too many repeated characters. Please correct and try again.', 'error')
         return redirect(url_for('user.dashboard'))
     
-    message_id = None
+    # Named fields are only filled in by bulk sends from a CSV; rendering still
+    # turns {{ and }} into braces, so both send paths store the same text
     try:
-        # Create message record
-        logger.info("Creating message record in database")
-        message_id = Message.create(phone_number, message, session['user_id'])
-        if not message_id:
-            logger.error("Failed to create message record")
-            flash('Failed to save message. Please try again.', 'error')
-            return redirect(url_for('user.dashboard'))
-
-        logger.info(f"Created message with ID: {message_id}")
-
-        # Update status to sending
-        logger.info("Updating message status to 'sending'")
-        Message.update_status(message_id, 'sending')
-
-        # Send message using GammuService singleton instance
-        logger.info("Attempting to send message via Gammu")
-        if gammu_service.send_sms(phone_number, message, message_id):
-            logger.info(f"Successfully sent message {message_id}")
-            Message.update_status(message_id, 'sent')
-            flash('Message sent successfully', 'success')
-        else:
-            logger.error(f"Failed to send message {message_id}")
-            Message.update_status(message_id, 'failed', 'Failed to send message')
-            flash('Failed to send message. Please try again.', 'error')
-
-    except ModemError as e:
-        logger.error(f"Modem error sending message {message_id}: {str(e)}")
-        if message_id:
-            Message.update_status(message_id, 'failed', f"Modem error: {str(e)}")
-        flash(f'Modem error: {str(e)}. Please check the modem connection.', 'error')
-    except SIMError as e:
-        logger.error(f"SIM error sending message {message_id}: {str(e)}")
-        if message_id:
-            Message.update_status(message_id, 'failed', f"SIM error: {str(e)}")
-        flash(f'SIM card error: {str(e)}. Please check the SIM card.', 'error')
-    except NetworkError as e:
-        logger.error(f"Network error sending message {message_id}: {str(e)}")
-        if message_id:
-            Message.update_status(message_id, 'failed', f"Network error: {str(e)}")
-        flash(f'Network error: {str(e)}. Please check the network connection.', 'error')
+        message = compile_template(message).render({})
+    except MissingFieldsError as e:
+        flash(f"Replace {', '.join('{' + field + '}' for field in e.fields)} before sending.", 'error')
+        return redirect(url_for('user.dashboard'))
+    
+    # Long messages go out as concatenated parts, up to a limit
+    segments = count_segments(message)
+    max_segments = current_app.config['MAX_SMS_SEGMENTS']
+    if segments > max_segments:
+        logger.warning(f"Message too long: {segments} segments")
+        flash(f'Message is too long ({segments} SMS parts). The maximum is {max_segments} parts.', 'error')
+        return redirect(url_for('user.dashboard'))
+    
+    try:
+        scheduled_at = parse_send_at(request.form.get('send_at'))
     except ValueError as e:
-        logger.error(f"Validation error sending message {message_id}: {str(e)}")
-        if message_id:
-            Message.update_status(message_id, 'failed', f"Validation error: {str(e)}")
-        flash(f'Message validation error: {str(e)}. Please correct and try again.', 'error')
-    except GammuError as e:
-        logger.error(f"Gammu error sending message {message_id}: {str(e)}")
-        if message_id:
-            Message.update_status(message_id, 'failed', f"Gammu error: {str(e)}")
-        flash(f'System error: {str(e)}. Please try again later.', 'error')
-    except Exception as e:
-        logger.error(f"Unexpected error sending message {message_id}: {str(e)}, type: {type(e)}")
-        logger.exception("Full traceback:")
-        if message_id:
-            Message.update_status(message_id, 'failed', f"Unexpected error: {str(e)}")
-        flash('An unexpected error occurred. Please try again later.', 'error')
+        flash(str(e), 'error')
+        return redirect(url_for('user.dashboard'))
+    
+    # Create message record; the dispatch worker sends it in the background
+    logger.info("Creating message record in database")
+    message_id = Message.create(phone_number, message, session['user_id'], scheduled_at)
+    if not message_id:
+        logger.error("Failed to create message record")
+        flash('Failed to save message. Please try again.', 'error')
+        return redirect(url_for('user.dashboard'))
+
+    if g.sms_dispatcher:
+        g.sms_dispatcher.notify()
+    if scheduled_at:
+        logger.info(f"Scheduled message with ID: {message_id} for {scheduled_at} UTC")
+        flash(f"Message scheduled for {request.form['send_at'].replace('T', ' ')} ({current_app.config['TIMEZONE']})", 'success')
+    else:
+        logger.info(f"Queued message with ID: {message_id}")
+        flash('Message queued for sending', 'success')
     
     logger.info("Finished SMS send process")
     return redirect(url_for('user.dashboard'))
@@ -508,4 +693,111 @@ def get_template(title):
     template = Template.get_by_title(title)
     if template:
         return jsonify({'content': template['content']})
-    return jsonify({'error': 'Template not found'}), 404 
\ No newline at end of file
+    return jsonify({'error': 'Template not found'}), 404
+
+@user_bp.route('/bulk-send', methods=['GET', 'POST'])
+@login_required
+def bulk_send():
+    """Queue one message, personalised per recipient, to many recipients as a single batch"""
+    if request.method == 'GET':
+        templates = Template.get_all()
+        return render_template('bulk_send.html',
+                            templates=templates,
+                            batch_id=request.args.get('batch_id', type=int),
+                            max_recipients=current_app.config['BULK_MAX_RECIPIENTS'])
+
+    logger.info("Starting bulk SMS send process")
+
+    if not check_rate_limit():
+        logger.warning("Rate limit exceeded")
+        flash('Rate limit exceeded. Please try again later.', 'error')
+        return redirect(url_for('user.bulk_send'))
+
+    message = request.form.get('message', '')
+    recipients = parse_recipients(request.form.get('recipients'), request.files.get('recipients_file'))
+
+    if not recipients:
+        flash('Please enter or upload at least one phone number.', 'error')
+        return redirect(url_for('user.bulk_send'))
+
+    max_recipients = current_app.config['BULK_MAX_RECIPIENTS']
+    if len(recipients) > max_recipients:
+        flash(f'Too many recipients ({len(recipients)}). The maximum per batch is {max_recipients}.', 'error')
+        return redirect(url_for('user.bulk_send'))
+
+    # Validate every number up front so a batch is either queued whole or not at all
+    invalid = [number for number, fields in recipients if not PHONE_NUMBER_PATTERN.match(number)]
+    if invalid:
+        logger.warning(f"Bulk send rejected: {len(invalid)} invalid phone numbers")
+        shown = ', '.join(invalid[:10])
+        more = f' and {len(invalid) - 10} more' if len(invalid) > 10 else ''
+        flash(f'Invalid phone numbers: {shown}{more}. Numbers must start with 07 and be 11 digits long.', 'error')
+        return redirect(url_for('user.bulk_send'))
+
+    if not message.strip():
+        flash('Message cannot be empty.', 'error')
+        return redirect(url_for('user.bulk_send'))
+
+    if re.search(r'([^X])\1{3,}', message):
+        logger.warning("Message contains too many repeated characters")
+        flash('Message contains too many repeated characters. Please correct and try again.', 'error')
+        return redirect(url_for('user.bulk_send'))
+
+    # Fill in {field} placeholders per recipient from the CSV columns
+    template = compile_template(message)
+    missing = [number for number, fields in recipients if template.missing(fields)]
+    if missing:
+        logger.warning(f"Bulk send rejected: {len(missing)} recipients missing template fields")
+        shown = ', '.join(missing[:10])
+        more = f' and {len(missing) - 10} more' if len(missing) > 10 else ''
+        needed = ', '.join('{' + field + '}' for field in template.fields)
+        flash(f'Missing values for {needed} for: {shown}{more}. '
+              f'Upload a CSV with a column for each field.', 'error')
+        return redirect(url_for('user.bulk_send'))
+    rendered = template.render_many(fields for number, fields in recipients)
+
+    max_segments = current_app.config['MAX_SMS_SEGMENTS']
+    too_long = [(number, result['segments']) for (number, fields), result in zip(recipients, rendered)
+                if result['segments'] > max_segments]
+    if too_long:
+        logger.warning(f"Bulk send rejected: {len(too_long)} messages over {max_segments} segments")
+        number, segments = max(too_long, key=lambda item: item[1])
+        flash(f'Message is too long for {len(too_long)} recipient(s), up to {segments} SMS parts '
+              f'(e.g. {number}). The maximum is {max_segments} parts.', 'error')
+        return redirect(url_for('user.bulk_send'))
+
+    try:
+        scheduled_at = parse_send_at(request.form.get('send_at'))
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('user.bulk_send'))
+
+    messages = [{'phone_number': number, 'content': result['text'], 'segments': result['segments']}
+                for (number, fields), result in zip(recipients, rendered)]
+    batch_id = MessageBatch.create(messages, session['user_id'], scheduled_at)
+    if not batch_id:
+        logger.error("Failed to create message batch")
+        flash('Failed to save messages. Please try again.', 'error')
+        return redirect(url_for('user.bulk_send'))
+
+    if g.sms_dispatcher:
+        g.sms_dispatcher.notify()
+    summary = f"{len(recipients)} messages, {sum(result['segments'] for result in rendered)} SMS parts"
+    if scheduled_at:
+        logger.info(f"Scheduled batch {batch_id} with {len(recipients)} messages for {scheduled_at} UTC")
+        flash(f"Batch #{batch_id} scheduled for {request.form['send_at'].replace('T', ' ')} "
+              f"({current_app.config['TIMEZONE']}): {summary}", 'success')
+    else:
+        logger.info(f"Queued batch {batch_id} with {len(recipients)} messages")
+        flash(f'Batch #{batch_id} queued: {summary}', 'success')
+    return redirect(url_for('user.bulk_send', batch_id=batch_id))
+
+@user_bp.route('/batch/<int:batch_id>')
+@login_required
+def batch_status(batch_id):
+    """Report progress of a bulk send batch"""
+    sender_id = None if session.get('is_admin') else session['user_id']
+    status = MessageBatch.get_status(batch_id, sender_id)
+    if status:
+        return jsonify(status)
+    return jsonify({'error': 'Batch not found'}), 404
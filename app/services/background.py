@@ -0,0 +1,72 @@
+"""
+Base class for background worker threads
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BackgroundWorker:
+    """Daemon thread that calls run_once() every interval seconds until stopped.
+
+    notify() wakes the thread early; subclasses can override next_wait() to
+    sleep for a computed time instead of the fixed interval.
+    """
+    name = 'background-worker'
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread"""
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"Started {self.name}")
+
+    def stop(self, timeout: float = 30):
+        """Stop the worker, letting the current iteration finish"""
+        if not self.is_running():
+            return
+        self._stop_event.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        logger.info(f"Stopped {self.name}")
+
+    def is_running(self) -> bool:
+        """Check if the worker thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def stopping(self) -> bool:
+        """Check if the worker has been asked to stop"""
+        return self._stop_event.is_set()
+
+    def notify(self):
+        """Wake the worker before its interval expires"""
+        self._wakeup.set()
+
+    def next_wait(self) -> float:
+        """Seconds to sleep before the next iteration"""
+        return self.interval
+
+    def run_once(self):
+        """Do one unit of work"""
+        raise NotImplementedError
+
+    def _run(self):
+        """Worker loop: run, then sleep until notified or the interval expires"""
+        while not self._stop_event.is_set():
+            self._wakeup.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error in {self.name}: {str(e)}", exc_info=True)
+            if self._stop_event.is_set():
+                break
+            self._wakeup.wait(self.next_wait())
@@ -6,9 +6,12 @@ import gammu
 import logging
 import os
 import threading
-from typing import Dict, Any, Optional
+import time
+from functools import wraps
+from typing import Dict, Any, List, Optional
 from ..config import Config
 from ..models import Message
+from ..sms_encoding import detect_encoding
 from ..exceptions import (
     ErrorCode,
     GammuError,
@@ -16,26 +19,63 @@ from ..exceptions import (
     SIMError,
     NetworkError,
     ConfigError,
-    DeviceError
+    DeviceError,
+    PartialSendError
 )
 
 # Get logger
 logger = logging.getLogger('gammu')
 
+# Gammu errors that mean the session is dead and must be re-established
+RECONNECT_ERRORS = tuple(
+    getattr(gammu, name) for name in (
+        'ERR_TIMEOUT',
+        'ERR_DEVICENOTEXIST',
+        'ERR_DEVICEOPENERROR',
+        'ERR_DEVICEREADERROR',
+        'ERR_DEVICEWRITEERROR',
+        'ERR_DEVICENOTWORK',
+        'ERR_NOTCONNECTED'
+    ) if hasattr(gammu, name)
+)
+
+# Gammu errors that mean the modem could not take the message right now
+BUSY_ERRORS = tuple(
+    getattr(gammu, name) for name in (
+        'ERR_BUSY',
+        'ERR_DEVICEBUSY',
+        'ERR_FULL'
+    ) if hasattr(gammu, name)
+)
+
+def _serialized(method):
+    """Run a method while holding the service's modem I/O lock"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._io_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class GammuService:
-    """Thread-safe singleton service for Gammu SMS functionality"""
-    _instance = None
+    """Thread-safe service for Gammu SMS functionality, one instance per modem.
+
+    Each gammurc section ([gammu], [gammu1], ...) describes one modem;
+    ``GammuService(section)`` always returns the same instance for a section.
+    """
+    _instances = {}
     _lock = threading.Lock()
 
-    def __new__(cls):
-        if cls._instance is None:
+    def __new__(cls, section: int = 0, config_file: Optional[str] = None):
+        key = (config_file or Config.GAMMU_CONFIG, section)
+        if key not in cls._instances:
             with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super(GammuService, cls).__new__(cls)
-                    cls._instance._initialized = False
-        return cls._instance
+                if key not in cls._instances:
+                    instance = super(GammuService, cls).__new__(cls)
+                    instance._initialized = False
+                    cls._instances[key] = instance
+        return cls._instances[key]
 
-    def __init__(self):
+    def __init__(self, section: int = 0, config_file: Optional[str] = None):
         """Initialize Gammu service"""
         if self._initialized:
             return
@@ -44,16 +84,35 @@ class GammuService:
             if self._initialized:
                 return
                 
-            logger.info("Initializing GammuService")
+            logger.info(f"Initializing GammuService for config section {section}")
+            self.section = section
+            self.config_file = config_file or Config.GAMMU_CONFIG
+            self.modem_id = f"modem{section}"
+            self.device = None
             self.state_machine = None
             self.connected = False
+            # Guards connect/disconnect state for this modem only
+            self._conn_lock = threading.Lock()
+            self.persistent = Config.GAMMU_PERSISTENT_SESSION
+            self.last_activity = 0.0
+            # Serializes all state machine I/O between the send worker and health checks
+            self._io_lock = threading.RLock()
+            self._stats_lock = threading.Lock()
+            self._latency = {
+                'persistent': {'count': 0, 'total': 0.0, 'min': None, 'max': None, 'last': None},
+                'reconnect': {'count': 0, 'total': 0.0, 'min': None, 'max': None, 'last': None}
+            }
             
             try:
                 logger.debug("Creating Gammu state machine")
                 self.state_machine = gammu.StateMachine()
                 logger.debug("Reading Gammu config")
-                self.state_machine.ReadConfig(Filename=Config.GAMMU_CONFIG)
-                logger.info("Successfully initialized GammuService")
+                self.state_machine.ReadConfig(Section=section, Filename=self.config_file)
+                try:
+                    self.device = self.state_machine.GetConfig(section).get('Device')
+                except Exception as e:
+                    logger.warning(f"Could not read device for config section {section}: {e}")
+                logger.info(f"Successfully initialized GammuService for {self.modem_id} ({self.device})")
             except Exception as e:
                 logger.error(f"Failed to initialize GammuService: {e}")
                 raise GammuError(f"Failed to initialize Gammu: {str(e)}", ErrorCode.GAMMU_INIT_FAILED)
@@ -66,7 +125,7 @@ class GammuService:
 
     def connect(self) -> bool:
         """Connect to the modem"""
-        with self._lock:
+        with self._conn_lock:
             if self.connected:
                 logger.debug("Already connected")
                 return True
@@ -74,6 +133,7 @@ class GammuService:
             try:
                 self.state_machine.Init()
                 self.connected = True
+                self.last_activity = time.monotonic()
                 logger.info("Successfully connected to modem")
                 return True
             except gammu.ERR_DEVICENOTEXIST:
@@ -91,59 +151,139 @@ class GammuService:
 
     def disconnect(self):
         """Disconnect from the modem"""
-        with self._lock:
+        with self._conn_lock:
             if not self.connected:
                 logger.debug("Already disconnected")
                 return
 
             try:
                 self.state_machine.Terminate()
-                self.connected = False
                 logger.info("Successfully disconnected from modem")
             except Exception as e:
                 logger.error(f"Error during disconnect: {e}")
                 # Don't raise here as we're likely cleaning up
+            finally:
+                # A failed Terminate() still leaves the session unusable
+                self.connected = False
+
+    def reconnect(self) -> bool:
+        """Drop the current session and reconnect with exponential backoff"""
+        attempts = max(1, Config.GAMMU_RECONNECT_ATTEMPTS)
+        delay = Config.GAMMU_RECONNECT_BASE_DELAY
+        for attempt in range(1, attempts + 1):
+            self.disconnect()
+            try:
+                return self.connect()
+            except ModemError as e:
+                if attempt == attempts:
+                    raise
+                logger.warning(f"Reconnect attempt {attempt}/{attempts} failed, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, Config.GAMMU_RECONNECT_MAX_DELAY)
+
+    def ensure_connected(self) -> bool:
+        """Make sure the long-lived session is usable, probing it if it has been idle"""
+        with self._io_lock:
+            if not self.connected:
+                return self.reconnect()
+
+            if time.monotonic() - self.last_activity < Config.GAMMU_PROBE_INTERVAL:
+                return True
+
+            try:
+                # AT+CSQ is the cheapest command that still round-trips to the modem
+                self.state_machine.GetSignalQuality()
+                self.last_activity = time.monotonic()
+                return True
+            except RECONNECT_ERRORS as e:
+                logger.warning(f"Modem session probe failed, reconnecting: {e}")
+                return self.reconnect()
+            except Exception as e:
+                # The modem answered, it just didn't like the probe
+                logger.debug(f"Modem session probe returned an error: {e}")
+                return True
+
+    def _record_latency(self, mode: str, elapsed: float):
+        """Record the latency of a successful send"""
+        with self._stats_lock:
+            stats = self._latency[mode]
+            stats['count'] += 1
+            stats['total'] += elapsed
+            stats['last'] = elapsed
+            stats['min'] = elapsed if stats['min'] is None else min(stats['min'], elapsed)
+            stats['max'] = elapsed if stats['max'] is None else max(stats['max'], elapsed)
+
+    def get_send_stats(self) -> Dict[str, Any]:
+        """Get per-send latency in milliseconds, split by session mode"""
+        with self._stats_lock:
+            result = {'mode': 'persistent' if self.persistent else 'reconnect'}
+            for mode, stats in self._latency.items():
+                count = stats['count']
+                result[mode] = {
+                    'count': count,
+                    'avg_ms': round(stats['total'] / count * 1000, 1) if count else None,
+                    'min_ms': round(stats['min'] * 1000, 1) if count else None,
+                    'max_ms': round(stats['max'] * 1000, 1) if count else None,
+                    'last_ms': round(stats['last'] * 1000, 1) if count else None
+                }
+            return result
 
     def is_connected(self) -> bool:
         """Check if connected to modem"""
-        with self._lock:
+        with self._conn_lock:
             return self.connected and self.state_machine is not None
 
-    def get_modem_info(self) -> Dict[str, Any]:
-        """Get comprehensive modem information"""
+    @_serialized
+    def get_signal_status(self) -> Dict[str, Any]:
+        """Get the fast-changing modem state: security status and signal quality"""
+        if not self.connected:
+            self.connect()
+
+        info = {}
         try:
-            if not self.connected:
-                self.connect()
-            
-            info = {}
-            
-            # Try each command separately and catch errors
-            try:
-                info['security'] = self.state_machine.GetSecurityStatus()
-            except Exception as e:
-                logger.warning(f"Failed to get security status: {e}")
-                info['security'] = None
+            info['security'] = self.state_machine.GetSecurityStatus()
+        except Exception as e:
+            logger.warning(f"Failed to get security status: {e}")
+            info['security'] = None
 
-            try:
-                info['signal'] = self.state_machine.GetSignalQuality()
-            except Exception as e:
-                logger.warning(f"Failed to get signal quality: {e}")
-                info['signal'] = None
+        try:
+            info['signal'] = self.state_machine.GetSignalQuality()
+            # A successful round-trip also proves the persistent session is alive
+            self.last_activity = time.monotonic()
+        except Exception as e:
+            logger.warning(f"Failed to get signal quality: {e}")
+            info['signal'] = None
 
-            # Skip battery check since device is USB powered
-            info['battery'] = {'ChargeState': 'USB_POWERED', 'BatteryPercent': None}
+        # Skip battery check since device is USB powered
+        info['battery'] = {'ChargeState': 'USB_POWERED', 'BatteryPercent': None}
+        return info
 
-            try:
-                info['manufacturer'] = self.state_machine.GetManufacturer()
-            except Exception as e:
-                logger.warning(f"Failed to get manufacturer: {e}")
-                info['manufacturer'] = None
+    @_serialized
+    def get_device_info(self) -> Dict[str, Any]:
+        """Get static modem identification: manufacturer and model"""
+        if not self.connected:
+            self.connect()
 
-            try:
-                info['model'] = self.state_machine.GetModel()
-            except Exception as e:
-                logger.warning(f"Failed to get model: {e}")
-                info['model'] = None
+        info = {}
+        try:
+            info['manufacturer'] = self.state_machine.GetManufacturer()
+        except Exception as e:
+            logger.warning(f"Failed to get manufacturer: {e}")
+            info['manufacturer'] = None
+
+        try:
+            info['model'] = self.state_machine.GetModel()
+        except Exception as e:
+            logger.warning(f"Failed to get model: {e}")
+            info['model'] = None
+        return info
+
+    @_serialized
+    def get_modem_info(self) -> Dict[str, Any]:
+        """Get comprehensive modem information"""
+        try:
+            info = self.get_signal_status()
+            info.update(self.get_device_info())
 
             # If we got at least some information, return it
             if any(v is not None for v in info.values()):
@@ -156,6 +296,7 @@ class GammuService:
             logger.error(f"Failed to get modem info: {e}")
             raise ModemError(f"Failed to get modem info: {str(e)}", ErrorCode.MODEM_STATUS_ERROR)
 
+    @_serialized
     def get_sim_status(self) -> Dict[str, Any]:
         """Get SIM card status"""
         logger.debug("Getting SIM status")
@@ -191,6 +332,7 @@ class GammuService:
             logger.error(f"Failed to get SIM status: {e}")
             raise SIMError(f"Failed to get SIM status: {str(e)}", ErrorCode.SIM_STATUS_ERROR)
 
+    @_serialized
     def get_network_status(self) -> Dict[str, Any]:
         """Get network status"""
         logger.debug("Getting network status")
@@ -202,29 +344,99 @@ class GammuService:
             logger.error(f"Failed to get network status: {e}")
             raise NetworkError(f"Failed to get network status: {str(e)}", ErrorCode.NETWORK_STATUS_ERROR)
 
-    def send_sms(self, phone_number: str, message: str, message_id: Optional[int] = None) -> bool:
-        """Send SMS message"""
+    @_serialized
+    def read_stored_sms(self) -> List[List[Dict[str, Any]]]:
+        """Read every message stored on the modem, without deleting anything"""
+        if self.persistent:
+            self.ensure_connected()
+        elif not self.connected:
+            self.connect()
+
+        messages = []
+        try:
+            sms = self.state_machine.GetNextSMS(Folder=0, Start=True)
+            while True:
+                messages.append(sms)
+                sms = self.state_machine.GetNextSMS(Folder=0, Location=sms[0]['Location'])
+        except gammu.ERR_EMPTY:
+            # Reached the end of the message list
+            pass
+        except Exception as e:
+            logger.error(f"Failed to read stored SMS: {e}")
+            if isinstance(e, RECONNECT_ERRORS):
+                self.disconnect()
+            raise GammuError(f"Failed to read stored SMS: {str(e)}", ErrorCode.SMS_READ_ERROR)
+        self.last_activity = time.monotonic()
+        return messages
+
+    @_serialized
+    def delete_sms(self, folder: int, location: int):
+        """Delete a stored message from the modem"""
+        try:
+            self.state_machine.DeleteSMS(folder, location)
+        except gammu.ERR_EMPTY:
+            # Already gone
+            pass
+        except Exception as e:
+            logger.error(f"Failed to delete SMS at location {location}: {e}")
+            raise GammuError(f"Failed to delete SMS: {str(e)}", ErrorCode.SMS_READ_ERROR)
+
+    @_serialized
+    def send_sms(self, phone_number: str, message: str, message_id: Optional[int] = None) -> List[Optional[int]]:
+        """Send SMS message, returning the TP message reference of every part sent"""
         logger.info(f"Sending SMS to {phone_number} (message_id: {message_id})")
         
-        # Always disconnect and reconnect to ensure fresh connection
-        self.disconnect()
-        self.connect()
+        mode = 'persistent' if self.persistent else 'reconnect'
+        # Latency includes session setup, which is what the persistent mode saves
+        started = time.monotonic()
+        if self.persistent:
+            # Reuse the long-lived session, reconnecting only if it has died
+            self.ensure_connected()
+        else:
+            # Disconnect and reconnect to ensure fresh connection
+            self.disconnect()
+            self.connect()
         
         try:
-            # Prepare message data
-            message_data = {
-                'Text': message,
-                'SMSC': {'Location': 1},
-                'Number': phone_number,
-                'Class': 1  # Ensure message displays on phone
-            }
+            # Let gammu split the text into concatenated parts in the right alphabet
+            encoding = detect_encoding(message)
+            parts = gammu.EncodeSMS({
+                'Class': 1,  # Ensure message displays on phone
+                'Unicode': encoding == 'ucs2',
+                'Entries': [{'ID': 'ConcatenatedTextLong', 'Buffer': message}]
+            })
 
             # Send message
-            logger.debug(f"Sending message (id: {message_id})")
-            self.state_machine.SendSMS(message_data)
-            logger.info(f"Successfully sent SMS to {phone_number} (message_id: {message_id})")
-            return True
+            logger.debug(f"Sending message (id: {message_id}) as {len(parts)} {encoding} part(s)")
+            references = []
+            for part in parts:
+                part['SMSC'] = {'Location': 1}
+                part['Number'] = phone_number
+                if Config.DELIVERY_REPORTS:
+                    # An SMS-SUBMIT with the status report request bit set
+                    part['Type'] = 'Status_Report'
+                try:
+                    references.append(self.state_machine.SendSMS(part))
+                except Exception as e:
+                    if not references:
+                        raise
+                    # Sending the rest again would duplicate the parts already
+                    # delivered, and a new encoding could not join up with them
+                    logger.error(f"Sent {len(references)} of {len(parts)} parts to {phone_number} "
+                                 f"(message_id: {message_id}) before failing: {e}")
+                    if not self.persistent or isinstance(e, RECONNECT_ERRORS):
+                        self.disconnect()
+                    raise PartialSendError(f"{len(references)} of {len(parts)} parts sent, then: {str(e)}",
+                                           references, len(parts), original_error=e)
+            elapsed = time.monotonic() - started
+            self.last_activity = time.monotonic()
+            self._record_latency(mode, elapsed)
+            logger.info(f"Successfully sent SMS to {phone_number} (message_id: {message_id}) "
+                        f"in {len(parts)} part(s), {elapsed * 1000:.0f} ms ({mode} session)")
+            return references
 
+        except PartialSendError:
+            raise
         except gammu.ERR_EMPTY:
             logger.error(f"Empty message (message_id: {message_id})")
             raise ValueError("Message cannot be empty")
@@ -233,13 +445,24 @@ class GammuService:
             raise ValueError("Invalid phone number")
         except gammu.ERR_NETWORK_ERROR:
             logger.error(f"Network error sending to {phone_number} (message_id: {message_id})")
-            self.disconnect()  # Force disconnect on network error
+            if not self.persistent:
+                self.disconnect()  # Force disconnect on network error
             raise NetworkError("Failed to send SMS: Network error", ErrorCode.NETWORK_ERROR)
         except gammu.ERR_TIMEOUT:
             logger.error(f"Operation timed out sending to {phone_number} (message_id: {message_id})")
-            self.disconnect()  # Force disconnect on timeout
+            self.disconnect()  # Force disconnect on timeout; the next send reconnects
             raise NetworkError("Failed to send SMS: Timeout", ErrorCode.NETWORK_TIMEOUT)
         except Exception as e:
             logger.error(f"Failed to send SMS to {phone_number} (message_id: {message_id}): {e}")
-            self.disconnect()  # Force disconnect on any error
-            raise GammuError(f"Failed to send SMS: {str(e)}", ErrorCode.SMS_SEND_ERROR) 
\ No newline at end of file
+            if not self.persistent or isinstance(e, RECONNECT_ERRORS):
+                self.disconnect()  # Force disconnect on session errors
+            # Lost sessions and a busy modem are worth another attempt; anything
+            # else (a CMS error, a barred or invalid destination) is the network
+            # or modem rejecting this message, and would be rejected again
+            if isinstance(e, RECONNECT_ERRORS):
+                error_code = ErrorCode.SMS_SEND_ERROR
+            elif isinstance(e, BUSY_ERRORS):
+                error_code = ErrorCode.MODEM_BUSY
+            else:
+                error_code = ErrorCode.MESSAGE_SEND_FAILED
+            raise GammuError(f"Failed to send SMS: {str(e)}", error_code, original_error=e) 
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Background modem health poller
+"""
+
+import copy
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional
+from ..config import Config
+from .background import BackgroundWorker
+
+logger = logging.getLogger(__name__)
+
+class ModemHealthPoller(BackgroundWorker):
+    """Refreshes a modem/SIM/network snapshot so /health never touches the serial port.
+
+    Signal, security, SIM and network state are refreshed every
+    ``interval`` seconds; manufacturer and model only every
+    ``static_interval`` seconds, since they do not change while running.
+    ``on_update``, if set, is called after every refresh.
+    """
+    name = 'modem-health-poller'
+
+    def __init__(self, gammu_service, interval: Optional[float] = None, static_interval: Optional[float] = None):
+        super().__init__(interval or Config.HEALTH_POLL_INTERVAL)
+        self.gammu_service = gammu_service
+        self.static_interval = static_interval or Config.HEALTH_STATIC_POLL_INTERVAL
+        self.on_update = None
+        self._lock = threading.Lock()
+        self._snapshot = {
+            'modem': None,
+            'device': None,
+            'sim': None,
+            'network': None,
+            'updated_at': None,
+            'static_updated_at': None
+        }
+
+    def run_once(self):
+        """Refresh the dynamic fields, and the static ones when they are due"""
+        static_updated_at = self._snapshot['static_updated_at']
+        if static_updated_at is None or time.time() - static_updated_at >= self.static_interval:
+            self.refresh_static()
+        self.refresh_dynamic()
+        if self.on_update:
+            self.on_update()
+
+    def refresh_dynamic(self):
+        """Poll signal, security, SIM and network state"""
+        try:
+            modem = self.gammu_service.get_signal_status()
+        except Exception as e:
+            logger.error(f"Modem health poll failed: {str(e)}")
+            modem = None
+
+        try:
+            sim = self.gammu_service.get_sim_status()
+        except Exception as e:
+            logger.error(f"SIM health poll failed: {str(e)}")
+            sim = None
+
+        try:
+            network = self.gammu_service.get_network_status()
+        except Exception as e:
+            logger.error(f"Network health poll failed: {str(e)}")
+            network = None
+
+        with self._lock:
+            self._snapshot.update({
+                'modem': modem,
+                'sim': sim,
+                'network': network,
+                'updated_at': time.time()
+            })
+
+    def refresh_static(self):
+        """Poll manufacturer and model"""
+        try:
+            device = self.gammu_service.get_device_info()
+        except Exception as e:
+            logger.error(f"Modem device info poll failed: {str(e)}")
+            return
+
+        with self._lock:
+            self._snapshot.update({
+                'device': device,
+                'static_updated_at': time.time()
+            })
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """Get a copy of the latest snapshot with its age in seconds"""
+        with self._lock:
+            snapshot = copy.deepcopy(self._snapshot)
+        updated_at = snapshot['updated_at']
+        snapshot['age'] = round(time.time() - updated_at, 1) if updated_at else None
+        return snapshot
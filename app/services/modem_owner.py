@@ -0,0 +1,80 @@
+"""
+Single modem owner across web server processes
+"""
+
+import fcntl
+import logging
+import os
+from typing import Optional
+from ..config import Config
+from .background import BackgroundWorker
+
+logger = logging.getLogger(__name__)
+
+class ModemOwnerLock:
+    """Exclusive, non-blocking flock on a lock file.
+
+    The kernel drops the lock when the holding process exits, however it
+    exits, so a crashed owner never leaves the modems stranded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def try_acquire(self) -> bool:
+        """Take the lock if no other process holds it"""
+        if self._file is not None:
+            return True
+        lock_file = open(self.path, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        """Give the lock up"""
+        if self._file is None:
+            return
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def is_held(self) -> bool:
+        """Check if this process holds the lock"""
+        return self._file is not None
+
+class ModemOwnerElection(BackgroundWorker):
+    """Keeps trying to become the modem owner, then calls ``on_acquired`` once.
+
+    Processes that lose the election only enqueue messages; if the owner
+    dies, one of them takes over within ``MODEM_OWNER_RETRY_INTERVAL``.
+    """
+    name = 'modem-owner-election'
+
+    def __init__(self, lock: ModemOwnerLock, on_acquired, interval: Optional[float] = None):
+        super().__init__(interval or Config.MODEM_OWNER_RETRY_INTERVAL)
+        self.lock = lock
+        self.on_acquired = on_acquired
+
+    def run_once(self):
+        """Try the lock; the first success starts the modem services"""
+        if self.lock.is_held():
+            return
+        if self.lock.try_acquire():
+            logger.info(f"Process {os.getpid()} is now the modem owner")
+            try:
+                self.on_acquired()
+            except Exception:
+                # Let another process have a go rather than holding a dead lock
+                self.lock.release()
+                raise
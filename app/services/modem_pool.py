@@ -0,0 +1,335 @@
+"""
+Pool of modems with one send worker each
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+from ..config import Config
+from .background import BackgroundWorker
+from .gammu_service import GammuService
+from .health_poller import ModemHealthPoller
+from .retry_policy import backoff_delay, is_retryable
+from .send_scheduler import SendScheduler
+from .sms_reader import SMSReader
+from .status_writer import StatusWriter
+from ..models import Message, ModemStatus
+from ..exceptions import (
+    GammuError,
+    ModemError,
+    SIMError,
+    NetworkError,
+    PartialSendError
+)
+
+logger = logging.getLogger(__name__)
+
+class ModemWorker(BackgroundWorker):
+    """Sends the messages the dispatcher assigns to one modem.
+
+    Messages arrive already claimed (``status='sending'``), with their
+    destination's pacing token already taken by the dispatcher; the worker
+    only sends them in order and records the outcome, then calls ``on_done``
+    so the dispatcher can hand out more work. Each send first reserves a slot
+    in the modem's buckets with the scheduler.
+
+    While it holds messages the worker renews their leases, so a paced
+    message is never mistaken for one orphaned by a crash.
+    """
+
+    def __init__(self, app, gammu_service, health_poller, on_done=None,
+                 scheduler: Optional[SendScheduler] = None, poll_interval: Optional[float] = None,
+                 status_writer: Optional[StatusWriter] = None):
+        super().__init__(poll_interval or Config.QUEUE_POLL_INTERVAL)
+        self.app = app
+        self.gammu_service = gammu_service
+        self.health_poller = health_poller
+        self.scheduler = scheduler
+        # Outcomes go through the batching writer when there is one
+        self.status_writer = status_writer or Message
+        self.sms_reader = None
+        self.on_done = on_done
+        self.modem_id = gammu_service.modem_id
+        self.name = f"modem-worker-{self.modem_id}"
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._retry_in = None
+        self._sending_id = None
+        self._leases_renewed_at = time.monotonic()
+
+    def submit(self, message):
+        """Assign a claimed message to this modem"""
+        with self._lock:
+            self._pending.append(message)
+            self._outstanding += 1
+        self.notify()
+
+    def outstanding(self) -> int:
+        """Number of assigned messages not yet finished"""
+        with self._lock:
+            return self._outstanding
+
+    def is_healthy(self) -> bool:
+        """Check the latest health snapshot: signal present and SIM ready"""
+        snapshot = self.health_poller.get_snapshot()
+        if snapshot['updated_at'] is None:
+            # Not polled yet; let the first send find out
+            return True
+
+        modem = snapshot['modem']
+        sim = snapshot['sim']
+        if not modem or not modem.get('signal') or modem['signal'].get('SignalPercent', 0) <= 0:
+            return False
+        if not sim or sim.get('status') != 'ready':
+            return False
+        return True
+
+    def next_wait(self) -> float:
+        """Wake up as soon as a paced message may go out"""
+        if self._retry_in is not None:
+            return min(self.interval, self._retry_in)
+        return self.interval
+
+    def _next_sendable(self):
+        """Pop the next assigned message if the modem's pacing lets it through.
+
+        Returns ``(message, None)``, or ``(None, wait)`` where wait is the
+        seconds until the modem may send, or None if nothing is assigned.
+        """
+        with self._lock:
+            if not self._pending:
+                return None, None
+            wait = self.scheduler.reserve(self.modem_id) if self.scheduler else 0
+            if wait > 0:
+                return None, wait
+            message = self._pending.popleft()
+            self._sending_id = message['id']
+            return message, None
+
+    def _renew_leases(self):
+        """Heartbeat: extend the leases of held messages once a third of the timeout has passed"""
+        now = time.monotonic()
+        if now - self._leases_renewed_at < Config.SEND_LEASE_TIMEOUT / 3:
+            return
+        with self._lock:
+            held = [message['id'] for message in self._pending]
+            if self._sending_id is not None:
+                held.append(self._sending_id)
+        if Message.renew_leases(held):
+            self._leases_renewed_at = now
+
+    def run_once(self):
+        """Send everything assigned to this modem, as fast as pacing allows"""
+        self._retry_in = None
+        with self.app.app_context():
+            self._renew_leases()
+            while not self.stopping():
+                message, wait = self._next_sendable()
+                if message is None:
+                    if wait is not None:
+                        logger.debug(f"{self.modem_id} paced, next send in {wait:.2f}s")
+                    self._retry_in = wait
+                    return
+                try:
+                    self._send(message)
+                finally:
+                    with self._lock:
+                        self._sending_id = None
+                        self._outstanding -= 1
+                    if self.on_done:
+                        self.on_done(self)
+
+    def stop(self, timeout: float = 30):
+        """Stop the worker and put anything it had not started back in the queue"""
+        super().stop(timeout)
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+            self._outstanding -= len(pending)
+        if pending:
+            with self.app.app_context():
+                for message in pending:
+                    Message.update_status(message['id'], 'queued')
+            logger.info(f"Requeued {len(pending)} unsent messages from {self.modem_id}")
+
+    def _send(self, message):
+        """Send a single claimed message and record the outcome"""
+        message_id = message['id']
+        logger.info(f"Sending message {message_id} on {self.modem_id}")
+
+        try:
+            references = self.gammu_service.send_sms(message['phone_number'], message['content'], message_id)
+            if references:
+                logger.info(f"Successfully sent message {message_id}")
+                self.status_writer.mark_sent(message_id, references, self.modem_id)
+            else:
+                logger.error(f"Failed to send message {message_id}")
+                self._fail(message, 'Failed to send message')
+        except PartialSendError as e:
+            # Some parts are already on their way, so this is never retried
+            logger.error(f"Message {message_id} was only partly sent: {str(e)}")
+            self.status_writer.record_partial(message_id, e.references, self.modem_id, f"Partially sent: {str(e)}")
+        except ModemError as e:
+            logger.error(f"Modem error sending message {message_id}: {str(e)}")
+            self._fail(message, f"Modem error: {str(e)}", e)
+        except SIMError as e:
+            logger.error(f"SIM error sending message {message_id}: {str(e)}")
+            self._fail(message, f"SIM error: {str(e)}", e)
+        except NetworkError as e:
+            logger.error(f"Network error sending message {message_id}: {str(e)}")
+            self._fail(message, f"Network error: {str(e)}", e)
+        except ValueError as e:
+            logger.error(f"Validation error sending message {message_id}: {str(e)}")
+            self._fail(message, f"Validation error: {str(e)}", e)
+        except GammuError as e:
+            logger.error(f"Gammu error sending message {message_id}: {str(e)}")
+            self._fail(message, f"Gammu error: {str(e)}", e)
+        except Exception as e:
+            logger.error(f"Unexpected error sending message {message_id}: {str(e)}, type: {type(e)}")
+            logger.exception("Full traceback:")
+            self._fail(message, f"Unexpected error: {str(e)}", e)
+
+    def _fail(self, message, error_message: str, error: Optional[Exception] = None):
+        """Record a failed attempt: retry transient errors with backoff, fail the rest"""
+        message_id = message['id']
+        attempts = message['attempts'] + 1
+        if error is None or not is_retryable(error):
+            self.status_writer.record_failure(message_id, 'failed', error_message)
+        elif attempts < Config.SEND_MAX_ATTEMPTS:
+            delay = backoff_delay(attempts)
+            logger.warning(f"Retrying message {message_id} in {delay:.0f}s "
+                           f"(attempt {attempts} of {Config.SEND_MAX_ATTEMPTS} failed)")
+            self.status_writer.record_failure(message_id, 'queued', error_message, retry_in=delay)
+        else:
+            logger.error(f"Message {message_id} failed {attempts} attempts, moving it to dead")
+            self.status_writer.record_failure(message_id, 'dead', f"{error_message} (after {attempts} attempts)")
+
+class ModemPool:
+    """One GammuService, health poller and send worker per configured modem.
+
+    ``select_worker()`` picks the healthy modem with the least outstanding
+    work; a modem whose signal or SIM check fails drops out of rotation
+    until its poller sees it recover.
+    """
+
+    def __init__(self, workers: List[ModemWorker], max_outstanding: Optional[int] = None,
+                 status_writer: Optional[StatusWriter] = None):
+        self.workers = workers
+        self.max_outstanding = max_outstanding or Config.MODEM_MAX_OUTSTANDING
+        self._in_rotation = {worker.modem_id: True for worker in workers}
+        self.scheduler = workers[0].scheduler if workers else None
+        self.status_writer = status_writer
+
+    @classmethod
+    def from_config(cls, app, on_done=None):
+        """Build a worker for every gammurc section in Config.GAMMU_SECTIONS"""
+        # Destination limits apply across modems, so the scheduler is shared;
+        # so is the status writer, which batches every modem's outcomes together
+        scheduler = SendScheduler()
+        status_writer = StatusWriter(app)
+        workers = []
+        for section in Config.GAMMU_SECTIONS or [0]:
+            gammu_service = GammuService(section)
+            health_poller = ModemHealthPoller(gammu_service)
+            health_poller.name = f"modem-health-poller-{gammu_service.modem_id}"
+            worker = ModemWorker(app, gammu_service, health_poller, on_done, scheduler,
+                                 status_writer=status_writer)
+            worker.sms_reader = SMSReader(app, gammu_service)
+            workers.append(worker)
+        logger.info(f"Modem pool created with {len(workers)} modem(s)")
+        pool = cls(workers, status_writer=status_writer)
+        for worker in workers:
+            worker.health_poller.on_update = pool.publish
+        return pool
+
+    @property
+    def primary(self) -> ModemWorker:
+        """The first configured modem"""
+        return self.workers[0]
+
+    def start(self):
+        """Start the status writer, then every health poller, send worker and SMS reader"""
+        if self.status_writer:
+            self.status_writer.start()
+        for worker in self.workers:
+            worker.health_poller.start()
+            worker.start()
+            if worker.sms_reader:
+                worker.sms_reader.start()
+
+    def stop(self):
+        """Stop every send worker, flush their outcomes, then stop every health poller and SMS reader"""
+        for worker in self.workers:
+            try:
+                worker.stop()
+            except Exception as e:
+                logger.error(f"Error stopping {worker.name}: {e}")
+        if self.status_writer:
+            try:
+                self.status_writer.stop()
+            except Exception as e:
+                logger.error(f"Error stopping {self.status_writer.name}: {e}")
+        for worker in self.workers:
+            for background in (worker.health_poller, worker.sms_reader):
+                if not background:
+                    continue
+                try:
+                    background.stop()
+                except Exception as e:
+                    logger.error(f"Error stopping {background.name}: {e}")
+
+    def disconnect(self):
+        """Release every modem"""
+        for worker in self.workers:
+            if worker.gammu_service.is_connected():
+                try:
+                    worker.gammu_service.disconnect()
+                except Exception as e:
+                    logger.error(f"Error disconnecting {worker.modem_id}: {e}")
+
+    def _update_rotation(self, worker: ModemWorker) -> bool:
+        """Re-check a modem's health, logging when it enters or leaves rotation"""
+        healthy = worker.is_healthy()
+        if healthy != self._in_rotation[worker.modem_id]:
+            self._in_rotation[worker.modem_id] = healthy
+            if healthy:
+                logger.info(f"{worker.modem_id} is healthy again, returning it to rotation")
+            else:
+                logger.warning(f"{worker.modem_id} failed its signal or SIM check, taking it out of rotation")
+        return healthy
+
+    def select_worker(self) -> Optional[ModemWorker]:
+        """Pick the healthy modem with the least outstanding work, or None if all are busy or down"""
+        best = None
+        best_outstanding = None
+        for worker in self.workers:
+            if not worker.is_running() or not self._update_rotation(worker):
+                continue
+            outstanding = worker.outstanding()
+            if outstanding >= self.max_outstanding:
+                continue
+            if best is None or outstanding < best_outstanding:
+                best = worker
+                best_outstanding = outstanding
+        return best
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-modem rotation state, load, send latency and health snapshot"""
+        return [{
+            'id': worker.modem_id,
+            'device': worker.gammu_service.device,
+            'in_rotation': self._in_rotation[worker.modem_id],
+            'outstanding': worker.outstanding(),
+            'pacing': self.scheduler.stats(worker.modem_id) if self.scheduler else None,
+            'send_latency': worker.gammu_service.get_send_stats(),
+            'health': worker.health_poller.get_snapshot()
+        } for worker in self.workers]
+
+    def publish(self):
+        """Store the pool's stats so other web server processes can report them"""
+        app = self.primary.app
+        with app.app_context():
+            ModemStatus.save_all(self.stats())
@@ -0,0 +1,150 @@
+"""
+Sliding-window request rate limiting
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+from flask import current_app
+from ..database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Stale counters are swept this often (seconds)
+SWEEP_INTERVAL = 300
+
+def sliding_count(current: int, previous: int, elapsed_fraction: float) -> float:
+    """Estimate requests in the last window from two fixed-window counters.
+
+    The previous window's count is weighted by how much of it still
+    overlaps the sliding window, which keeps the check O(1) per key.
+    """
+    return previous * (1 - elapsed_fraction) + current
+
+class MemoryRateLimitBackend:
+    """Counters in a dict, for a single worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._last_sweep = time.monotonic()
+
+    def _sweep(self, window_index: int):
+        """Drop counters too old to affect any window"""
+        now = time.monotonic()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        stale = [key for key, counter in self._counters.items() if counter[0] < window_index - 1]
+        for key in stale:
+            del self._counters[key]
+
+    def acquire(self, limits: List[Tuple[str, int]], window_index: int, elapsed_fraction: float) -> bool:
+        """Count one request against every key if all are under their limit"""
+        with self._lock:
+            self._sweep(window_index)
+            counters = []
+            for key, limit in limits:
+                counter = self._counters.get(key)
+                if counter is None:
+                    counter = self._counters[key] = [window_index, 0, 0]
+                elif counter[0] != window_index:
+                    # Roll the window: the old current becomes previous if adjacent
+                    previous = counter[1] if counter[0] == window_index - 1 else 0
+                    counter[:] = [window_index, 0, previous]
+                if sliding_count(counter[1], counter[2], elapsed_fraction) >= limit:
+                    return False
+                counters.append(counter)
+            for counter in counters:
+                counter[1] += 1
+            return True
+
+class SQLiteRateLimitBackend:
+    """Counters in the rate_limits table, shared by every worker process"""
+
+    def __init__(self):
+        self._last_sweep = time.monotonic()
+
+    def _sweep(self, db, window_index: int):
+        """Delete counters too old to affect any window"""
+        now = time.monotonic()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        db.execute('DELETE FROM rate_limits WHERE window_index < ?', (window_index - 1,))
+
+    def acquire(self, limits: List[Tuple[str, int]], window_index: int, elapsed_fraction: float) -> bool:
+        """Count one request against every key if all are under their limit"""
+        db = get_db()
+        try:
+            # Take the write lock up front so check-and-increment is atomic across processes
+            if not db.in_transaction:
+                db.execute('BEGIN IMMEDIATE')
+            self._sweep(db, window_index)
+            allowed = True
+            for key, limit in limits:
+                counter = db.execute('''
+                    INSERT INTO rate_limits (key, window_index, current_count, previous_count)
+                    VALUES (?, ?, 0, 0)
+                    ON CONFLICT(key) DO UPDATE SET
+                        previous_count = CASE
+                            WHEN window_index = excluded.window_index THEN previous_count
+                            WHEN window_index = excluded.window_index - 1 THEN current_count
+                            ELSE 0
+                        END,
+                        current_count = CASE
+                            WHEN window_index = excluded.window_index THEN current_count
+                            ELSE 0
+                        END,
+                        window_index = excluded.window_index
+                    RETURNING current_count, previous_count
+                ''', (key, window_index)).fetchone()
+                if sliding_count(counter['current_count'], counter['previous_count'], elapsed_fraction) >= limit:
+                    allowed = False
+                    break
+            if allowed:
+                db.executemany(
+                    'UPDATE rate_limits SET current_count = current_count + 1 WHERE key = ?',
+                    [(key,) for key, limit in limits]
+                )
+            db.commit()
+            return allowed
+        except sqlite3.Error as e:
+            db.rollback()
+            # Fail open: a locked database should not lock users out
+            logger.error(f"Rate limit check failed: {str(e)}")
+            return True
+
+BACKENDS = {
+    'memory': MemoryRateLimitBackend,
+    'sqlite': SQLiteRateLimitBackend
+}
+
+class RateLimiter:
+    """Sliding-window limiter over a pluggable counter backend"""
+
+    def __init__(self, backend, window: float):
+        self.backend = backend
+        self.window = window
+
+    def allow(self, limits: List[Tuple[str, int]]) -> bool:
+        """Check and count one request against each ``(key, limit)`` pair"""
+        now = time.time()
+        window_index = int(now // self.window)
+        elapsed_fraction = (now % self.window) / self.window
+        return self.backend.acquire(limits, window_index, elapsed_fraction)
+
+def get_rate_limiter(app=None):
+    """Get the rate limiter for an app, creating it on first use"""
+    app = app or current_app._get_current_object()
+    limiter = app.extensions.get('rate_limiter')
+    if limiter is None:
+        backend_name = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+        if backend_name not in BACKENDS:
+            raise ValueError(f"Invalid RATE_LIMIT_BACKEND: {backend_name}")
+        limiter = RateLimiter(BACKENDS[backend_name](), app.config.get('RATE_LIMIT_WINDOW', 60))
+        app.extensions['rate_limiter'] = limiter
+        logger.info(f"Using {backend_name} rate limit backend")
+    return limiter
@@ -0,0 +1,91 @@
+"""
+Message history retention and archival
+"""
+
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+import pytz
+from ..config import Config
+from ..database import get_db
+from .background import BackgroundWorker
+from ..models import Message
+
+logger = logging.getLogger(__name__)
+
+# Free pages returned to the filesystem per incremental_vacuum step
+VACUUM_STEP_PAGES = 1000
+
+class RetentionJob(BackgroundWorker):
+    """Moves finished messages older than ``RETENTION_DAYS`` out of the live table.
+
+    Each chunk is appended to a gzip NDJSON file per month of creation
+    (``messages-YYYY-MM.ndjson.gz``) and synced to disk before it is deleted
+    in its own short transaction, so the database is never locked for long
+    and nothing is deleted that was not archived. If the process dies in
+    between, the chunk is archived again on the next run. Archived messages
+    stay counted in message_stats. Freed pages are then handed back with
+    ``incremental_vacuum``.
+    """
+    name = 'retention-job'
+
+    def __init__(self, app, retention_days: Optional[int] = None, archive_dir: Optional[str] = None,
+                 chunk_size: Optional[int] = None, interval: Optional[float] = None):
+        super().__init__(interval or Config.RETENTION_INTERVAL)
+        self.app = app
+        self.retention_days = Config.RETENTION_DAYS if retention_days is None else retention_days
+        self.archive_dir = archive_dir or Config.RETENTION_ARCHIVE_DIR or os.path.join(
+            os.path.dirname(app.config['DATABASE']), 'archive')
+        self.chunk_size = chunk_size or Config.RETENTION_CHUNK_SIZE
+
+    def run_once(self):
+        """Archive and delete everything past the retention age, then vacuum"""
+        if self.retention_days <= 0:
+            return
+        cutoff = (datetime.now(pytz.UTC) - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        archived = 0
+        with self.app.app_context():
+            while not self.stopping():
+                rows = Message.get_archivable(cutoff, self.chunk_size)
+                if not rows:
+                    break
+                self._archive(rows)
+                if not Message.delete_many([row['id'] for row in rows], keep_stats=True):
+                    break
+                archived += len(rows)
+                if len(rows) < self.chunk_size:
+                    break
+            if archived:
+                logger.info(f"Archived {archived} messages created before {cutoff} to {self.archive_dir}")
+                self._vacuum()
+
+    def _archive(self, rows):
+        """Append rows to their monthly archive files and sync them to disk"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(str(row['created_at'])[:7], []).append(row)
+        for month, month_rows in by_month.items():
+            path = os.path.join(self.archive_dir, f"messages-{month}.ndjson.gz")
+            # Each append adds a gzip member; gzip readers treat them as one stream
+            with open(path, 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+                    for row in month_rows:
+                        line = json.dumps({key: row[key] for key in row.keys()}, default=str)
+                        archive.write(line.encode('utf-8') + b'\n')
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def _vacuum(self):
+        """Return freed pages to the filesystem a step at a time"""
+        db = get_db()
+        if db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            logger.info("Database is not in incremental auto-vacuum mode; freed pages will be reused "
+                        "but the file will not shrink")
+            return
+        while not self.stopping() and db.execute('PRAGMA freelist_count').fetchone()[0] > 0:
+            # executescript steps the pragma to completion; execute() frees a single page
+            db.executescript(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});')
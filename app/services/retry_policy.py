@@ -0,0 +1,45 @@
+"""
+Retry policy for failed sends
+"""
+
+import random
+from typing import Optional
+from ..config import Config
+from ..exceptions import ErrorCode, SMSToolException
+
+# Errors a later attempt can reasonably succeed on: a busy, unresponsive or
+# briefly unplugged modem, a dropped session or a network that is temporarily
+# unavailable. Anything else (bad number, SIM needing a PIN, a send the network
+# rejected) is permanent.
+RETRYABLE_ERROR_CODES = frozenset({
+    ErrorCode.DEVICE_BUSY,
+    ErrorCode.DEVICE_ACCESS_ERROR,
+    ErrorCode.MODEM_NOT_RESPONDING,
+    ErrorCode.MODEM_CONNECTION_FAILED,
+    ErrorCode.MODEM_NOT_FOUND,
+    ErrorCode.MODEM_BUSY,
+    ErrorCode.MODEM_OPEN_ERROR,
+    ErrorCode.MODEM_CONNECT_ERROR,
+    ErrorCode.MODEM_STATUS_ERROR,
+    ErrorCode.NETWORK_NOT_REGISTERED,
+    ErrorCode.NETWORK_TIMEOUT,
+    ErrorCode.NETWORK_ERROR,
+    ErrorCode.NETWORK_STATUS_ERROR,
+    ErrorCode.MESSAGE_QUEUE_FULL,
+    ErrorCode.SMS_SEND_ERROR  # the session was lost mid-send
+})
+
+def is_retryable(error: Exception) -> bool:
+    """Check if a send error is transient"""
+    return isinstance(error, SMSToolException) and error.error_code in RETRYABLE_ERROR_CODES
+
+def backoff_delay(attempts: int, base: Optional[float] = None, cap: Optional[float] = None) -> float:
+    """Seconds to wait before the next attempt, after ``attempts`` failed ones.
+
+    The delay doubles per attempt up to ``cap``; a random half of it is
+    jittered so messages that failed together do not all retry together.
+    """
+    base = Config.SEND_RETRY_BASE_DELAY if base is None else base
+    cap = Config.SEND_RETRY_MAX_DELAY if cap is None else cap
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
@@ -0,0 +1,156 @@
+"""
+Token bucket pacing for modem sends
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Optional
+from ..config import Config
+
+logger = logging.getLogger(__name__)
+
+# Idle destination buckets are dropped this often (seconds)
+PRUNE_INTERVAL = 300
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, holding at most ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        """Add the tokens earned since the last update"""
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available, 0 if one is available now"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def available(self, now: float) -> float:
+        """Tokens available right now"""
+        self._refill(now)
+        return self.tokens
+
+    def take(self):
+        """Spend one token; call only after wait_time() returned 0"""
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        """Check if the bucket has refilled completely, i.e. is as good as new"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class SendScheduler:
+    """Paces sends with token buckets per modem and per destination number.
+
+    Each modem has a short-term bucket (``MODEM_SEND_RATE`` per second, bursts
+    up to ``MODEM_SEND_BURST``) and an hourly bucket (``MODEM_HOURLY_LIMIT``),
+    and each destination number an hourly bucket (``DESTINATION_HOURLY_LIMIT``,
+    bursts up to ``DESTINATION_BURST``).
+
+    Destination tokens are taken when the dispatcher claims a message, and a
+    number without one is left in the queue so it never occupies a modem;
+    modem tokens are taken by the worker just before it sends.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modem_buckets: Dict[str, List[TokenBucket]] = {}
+        self._destination_buckets: Dict[str, TokenBucket] = {}
+        self._last_prune = time.monotonic()
+
+    def _buckets_for_modem(self, modem_id: str) -> List[TokenBucket]:
+        """Get or create the buckets for a modem"""
+        buckets = self._modem_buckets.get(modem_id)
+        if buckets is None:
+            buckets = []
+            if Config.MODEM_SEND_RATE > 0:
+                buckets.append(TokenBucket(Config.MODEM_SEND_RATE, max(1, Config.MODEM_SEND_BURST)))
+            if Config.MODEM_HOURLY_LIMIT > 0:
+                buckets.append(TokenBucket(Config.MODEM_HOURLY_LIMIT / 3600, Config.MODEM_HOURLY_LIMIT))
+            self._modem_buckets[modem_id] = buckets
+        return buckets
+
+    def _bucket_for_destination(self, phone_number: str) -> Optional[TokenBucket]:
+        """Get or create the bucket for a destination number"""
+        if Config.DESTINATION_HOURLY_LIMIT <= 0:
+            return None
+        bucket = self._destination_buckets.get(phone_number)
+        if bucket is None:
+            bucket = TokenBucket(Config.DESTINATION_HOURLY_LIMIT / 3600, max(1, Config.DESTINATION_BURST))
+            self._destination_buckets[phone_number] = bucket
+        return bucket
+
+    def _prune(self, now: float):
+        """Forget destination buckets that have refilled completely"""
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        idle = [number for number, bucket in self._destination_buckets.items() if bucket.is_full(now)]
+        for number in idle:
+            del self._destination_buckets[number]
+        if idle:
+            logger.debug(f"Pruned {len(idle)} idle destination buckets")
+
+    def reserve(self, modem_id: str) -> float:
+        """Try to reserve a send slot on a modem.
+
+        Returns 0 and takes a token from each of the modem's buckets if the
+        send may go ahead now, otherwise returns the seconds to wait and
+        takes nothing.
+        """
+        with self._lock:
+            now = time.monotonic()
+            buckets = self._buckets_for_modem(modem_id)
+            wait = max((bucket.wait_time(now) for bucket in buckets), default=0.0)
+            if wait > 0:
+                return wait
+            for bucket in buckets:
+                bucket.take()
+            return 0.0
+
+    def throttled_destinations(self) -> Dict[str, float]:
+        """Destination numbers with no token left, and the seconds until each gets one"""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            throttled = {}
+            for number, bucket in self._destination_buckets.items():
+                wait = bucket.wait_time(now)
+                if wait > 0:
+                    throttled[number] = wait
+            return throttled
+
+    def reserve_destination(self, phone_number: str) -> float:
+        """Take a token for a message claimed for a number that is not throttled.
+
+        Returns the seconds until the number has a token again, 0 if it
+        still has one.
+        """
+        with self._lock:
+            bucket = self._bucket_for_destination(phone_number)
+            if bucket is None:
+                return 0.0
+            now = time.monotonic()
+            if bucket.wait_time(now) <= 0:
+                bucket.take()
+            return bucket.wait_time(now)
+
+    def stats(self, modem_id: str) -> Dict[str, Any]:
+        """Tokens currently available to a modem"""
+        with self._lock:
+            now = time.monotonic()
+            tokens = [round(bucket.available(now), 2) for bucket in self._buckets_for_modem(modem_id)]
+        return {
+            'tokens': tokens,
+            'destinations_tracked': len(self._destination_buckets)
+        }
@@ -0,0 +1,106 @@
+"""
+Background SMS dispatch queue
+"""
+
+import logging
+import time
+from typing import Optional
+from ..config import Config
+from .background import BackgroundWorker
+from ..models import Message
+
+logger = logging.getLogger(__name__)
+
+class SMSDispatcher(BackgroundWorker):
+    """Coordinator thread that hands queued messages to the modem pool.
+
+    The queue itself is the ``messages`` table: routes insert rows with
+    ``status='queued'`` and call ``notify()``. The dispatcher claims rows in
+    insertion order (``queued -> sending``) for whichever modem the pool
+    selects; the modem's worker then records ``sent`` or ``failed``.
+
+    Scheduled messages are released into the queue as they fall due; the
+    dispatcher sleeps no longer than until the next one, or than until the
+    next message deferred by a retry backoff is due. Messages to a
+    number that has used up its pacing tokens stay queued, and later
+    messages to other numbers are claimed ahead of them.
+
+    Its first pass, before anything is claimed, and every half lease timeout
+    after that, it recovers messages left in 'sending' by a process that
+    died mid-send, according to ``STALE_SEND_POLICY``.
+    """
+    name = 'sms-dispatcher'
+
+    def __init__(self, app, modem_pool, poll_interval: Optional[float] = None):
+        super().__init__(poll_interval or Config.QUEUE_POLL_INTERVAL)
+        self.app = app
+        self.modem_pool = modem_pool
+        self._recovered_at = None
+        self._scheduled_in = None
+        self._throttled_in = None
+        self._retry_in = None
+        for worker in modem_pool.workers:
+            worker.on_done = self.worker_done
+
+    def run_once(self):
+        """Recover orphaned sends when due, release scheduled messages, then drain the queue"""
+        with self.app.app_context():
+            now = time.monotonic()
+            if self._recovered_at is None or now - self._recovered_at >= Config.SEND_LEASE_TIMEOUT / 2:
+                self.recover()
+                self._recovered_at = now
+            self.release_scheduled()
+            self.drain()
+            self._retry_in = Message.seconds_until_next_retry()
+
+    def next_wait(self) -> float:
+        """Wake up in time for the next scheduled message, retry or throttled number"""
+        waits = [wait for wait in (self._scheduled_in, self._retry_in, self._throttled_in) if wait is not None]
+        if waits:
+            return max(0.1, min(self.interval, *waits))
+        return self.interval
+
+    def release_scheduled(self):
+        """Queue scheduled messages that are due and note when the next one is"""
+        wait = Message.seconds_until_next_scheduled()
+        if wait is not None and wait <= 0:
+            released = Message.release_due()
+            if released:
+                logger.info(f"Released {released} scheduled messages into the queue")
+            wait = Message.seconds_until_next_scheduled()
+        self._scheduled_in = wait
+
+    def recover(self):
+        """Requeue or fail messages whose lease expired while 'sending'"""
+        policy = Config.STALE_SEND_POLICY
+        if policy not in ('requeue', 'fail'):
+            logger.warning(f"Unknown STALE_SEND_POLICY {policy}, using requeue")
+            policy = 'requeue'
+        recovered = Message.recover_stale(policy)
+        if recovered:
+            logger.warning(f"Recovered {recovered} interrupted sends ({policy})")
+
+    def drain(self):
+        """Assign queued messages to modems until the queue is empty or every modem is busy"""
+        scheduler = self.modem_pool.scheduler
+        throttled = scheduler.throttled_destinations() if scheduler else {}
+        try:
+            while not self.stopping():
+                worker = self.modem_pool.select_worker()
+                if not worker:
+                    return
+                message = Message.claim_next_queued(worker.modem_id, exclude_numbers=throttled)
+                if not message:
+                    return
+                if scheduler:
+                    wait = scheduler.reserve_destination(message['phone_number'])
+                    if wait > 0:
+                        throttled[message['phone_number']] = wait
+                logger.info(f"Dispatching message {message['id']} to {worker.modem_id}")
+                worker.submit(message)
+        finally:
+            self._throttled_in = min(throttled.values(), default=None)
+
+    def worker_done(self, worker):
+        """Called by a modem worker when it finishes a message"""
+        self.notify()
@@ -0,0 +1,161 @@
+"""
+Background reader for messages stored on a modem
+"""
+
+import gammu
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from ..config import Config
+from .background import BackgroundWorker
+from ..models import InboundMessage, MessageReference
+
+logger = logging.getLogger(__name__)
+
+def classify_delivery_status(delivery_status: int) -> str:
+    """Map a TP-Status value to 'delivered', 'pending' or 'failed' (3GPP TS 23.040 9.2.3.15)"""
+    if delivery_status < 0x20:
+        return 'delivered'
+    if delivery_status < 0x40:
+        # Temporary error, the SMSC is still trying
+        return 'pending'
+    return 'failed'
+
+def _multipart_key(part: Dict[str, Any]) -> Optional[Tuple]:
+    """Identify the message a concatenated part belongs to, or None for a single SMS"""
+    udh = part.get('UDH') or {}
+    if udh.get('AllParts', 0) <= 1:
+        return None
+    return (part.get('Number'), udh.get('ID8bit', -1), udh.get('ID16bit', -1), udh['AllParts'])
+
+def _decode_text(parts: List[Dict[str, Any]]) -> str:
+    """Join a linked message's parts back into its text"""
+    try:
+        decoded = gammu.DecodeSMS(parts)
+    except Exception as e:
+        logger.debug(f"DecodeSMS failed, joining part text instead: {str(e)}")
+        decoded = None
+    if decoded and decoded.get('Entries'):
+        text = ''.join(entry.get('Buffer') or '' for entry in decoded['Entries'])
+        if text:
+            return text
+    return ''.join(part.get('Text') or '' for part in parts)
+
+def _smsc_time(part: Dict[str, Any]) -> Optional[str]:
+    """SMSC timestamp of a part as an ISO string"""
+    value = part.get('DateTime')
+    return value.isoformat(sep=' ') if isinstance(value, datetime) else None
+
+class SMSReader(BackgroundWorker):
+    """Drains one modem's message storage so the SIM never fills up.
+
+    Every poll reads everything stored, links concatenated parts back into
+    whole messages and stores them in ``inbound_messages`` in one batch, and
+    applies final status reports to sent parts by TP message reference in
+    another. Locations are deleted from the modem only after their batch is
+    committed; if a write fails those messages stay for the next poll.
+
+    A multipart message whose parts have not all arrived is left on the SIM
+    until ``INBOX_PART_TIMEOUT`` passes, then stored with what did arrive.
+    """
+
+    def __init__(self, app, gammu_service, interval: Optional[float] = None,
+                 part_timeout: Optional[float] = None):
+        super().__init__(interval or Config.INBOX_POLL_INTERVAL)
+        self.app = app
+        self.gammu_service = gammu_service
+        self.modem_id = gammu_service.modem_id
+        self.name = f"sms-reader-{self.modem_id}"
+        self.part_timeout = part_timeout if part_timeout is not None else Config.INBOX_PART_TIMEOUT
+        # First time each incomplete multipart message was seen
+        self._incomplete_since = {}
+
+    def _collect_inbound(self, stored: List[List[Dict[str, Any]]], now: float):
+        """Link received parts into messages; returns (messages, locations)"""
+        try:
+            linked = gammu.LinkSMS(stored)
+        except Exception as e:
+            logger.warning(f"LinkSMS failed on {self.modem_id}, reading parts individually: {str(e)}")
+            linked = stored
+
+        # Parts LinkSMS could not join (e.g. some parts missing) come back separately
+        groups = {}
+        for parts in linked:
+            key = _multipart_key(parts[0])
+            if key is None or len(parts) >= key[3]:
+                groups[id(parts)] = parts
+            else:
+                groups.setdefault(key, []).extend(parts)
+
+        messages = []
+        locations = []
+        seen = set()
+        for key, parts in groups.items():
+            if isinstance(key, tuple) and len(parts) < key[3]:
+                first_seen = self._incomplete_since.setdefault(key, now)
+                if now - first_seen < self.part_timeout:
+                    seen.add(key)
+                    continue
+                logger.warning(f"Storing message from {key[0]} on {self.modem_id} with {len(parts)} of {key[3]} parts")
+            if isinstance(key, tuple):
+                parts.sort(key=lambda part: (part.get('UDH') or {}).get('PartNumber', 0))
+            messages.append({
+                'phone_number': parts[0].get('Number') or '',
+                'content': _decode_text(parts),
+                'parts': len(parts),
+                'smsc_time': _smsc_time(parts[0])
+            })
+            locations.extend((part.get('Folder', 0), part['Location']) for part in parts)
+
+        # Forget partial messages that have since completed or been stored
+        for key in list(self._incomplete_since):
+            if key not in seen:
+                del self._incomplete_since[key]
+        return messages, locations
+
+    def run_once(self):
+        """Read, store and delete received messages and status reports"""
+        reports = []
+        received = []
+        locations = []
+        for sms in self.gammu_service.read_stored_sms():
+            part = sms[0]
+            if part.get('Type') != 'Status_Report':
+                received.append(sms)
+                continue
+            locations.append((part.get('Folder', 0), part['Location']))
+            status = classify_delivery_status(part.get('DeliveryStatus', 0))
+            if status == 'pending':
+                logger.debug(f"Delivery still pending for reference {part.get('MessageReference')} on {self.modem_id}")
+                continue
+            reports.append({
+                'reference': part.get('MessageReference'),
+                'status': status,
+                'delivery_status': part.get('DeliveryStatus')
+            })
+
+        messages, inbound_locations = self._collect_inbound(received, time.monotonic()) if received else ([], [])
+
+        # Each kind is deleted only once it is safely in the database;
+        # anything that failed stays on the modem for the next poll
+        handled = []
+        with self.app.app_context():
+            if reports:
+                matched = MessageReference.apply_reports(self.modem_id, reports)
+                if matched is not None:
+                    logger.info(f"Applied {matched} of {len(reports)} status reports from {self.modem_id}")
+                    handled.extend(locations)
+            else:
+                handled.extend(locations)
+            if messages:
+                stored = InboundMessage.add_all(self.modem_id, messages)
+                if stored is not None:
+                    logger.info(f"Stored {stored} received messages from {self.modem_id}")
+                    handled.extend(inbound_locations)
+
+        for folder, location in handled:
+            try:
+                self.gammu_service.delete_sms(folder, location)
+            except Exception as e:
+                logger.error(f"Failed to delete message at location {location} on {self.modem_id}: {str(e)}")
@@ -0,0 +1,118 @@
+"""
+Batched writer for send outcomes
+"""
+
+import logging
+import threading
+from typing import Optional
+from ..config import Config
+from .background import BackgroundWorker
+from .retry_policy import backoff_delay
+from ..models import Message
+
+logger = logging.getLogger(__name__)
+
+class StatusWriter(BackgroundWorker):
+    """Collects send outcomes from the modem workers and commits them together.
+
+    Workers call ``mark_sent`` / ``record_failure`` (the same signatures as
+    on Message) and carry straight on; the writer flushes everything
+    collected in one transaction every ``STATUS_FLUSH_INTERVAL_MS`` or as
+    soon as ``STATUS_FLUSH_ROWS`` are waiting, so high send rates cost one
+    commit per batch instead of one per message. A batch that fails to
+    commit is kept and retried with backoff, up to
+    ``STATUS_FLUSH_MAX_ATTEMPTS`` times, renewing the leases of its
+    messages meanwhile so they are not recovered as interrupted sends.
+    ``stop()`` flushes whatever is left.
+    """
+    name = 'status-writer'
+
+    def __init__(self, app, flush_interval: Optional[float] = None, max_rows: Optional[int] = None,
+                 max_attempts: Optional[int] = None):
+        super().__init__(flush_interval or Config.STATUS_FLUSH_INTERVAL_MS / 1000)
+        self.app = app
+        self.max_rows = max_rows or Config.STATUS_FLUSH_ROWS
+        self.max_attempts = max_attempts or Config.STATUS_FLUSH_MAX_ATTEMPTS
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._updates = []
+        self._failures = 0
+        self._retry_in = None
+
+    def _add(self, update):
+        """Queue one outcome, waking the writer once a full batch is waiting"""
+        with self._lock:
+            self._updates.append(update)
+            full = len(self._updates) >= self.max_rows
+        # While backing off, a full batch waits like everything else
+        if full and not self._failures:
+            self.notify()
+        return True
+
+    def mark_sent(self, message_id, references=None, modem_id=None):
+        """Queue a 'sent' transition"""
+        return self._add(Message.sent_update(message_id, references, modem_id))
+
+    def record_failure(self, message_id, status, error_message, retry_in=None):
+        """Queue a failed attempt"""
+        return self._add(Message.failure_update(message_id, status, error_message, retry_in))
+
+    def record_partial(self, message_id, references, modem_id, error_message):
+        """Queue a partly sent multipart message"""
+        return self._add(Message.partial_update(message_id, references, modem_id, error_message))
+
+    def pending(self) -> int:
+        """Number of outcomes not yet written"""
+        with self._lock:
+            return len(self._updates)
+
+    def next_wait(self) -> float:
+        """Back off while the database keeps refusing the batch"""
+        if self._retry_in is not None:
+            return self._retry_in
+        return self.interval
+
+    def run_once(self):
+        """Write whatever has been collected"""
+        self.flush()
+
+    def flush(self) -> bool:
+        """Commit all collected outcomes in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                updates = self._updates
+                self._updates = []
+            if not updates:
+                return True
+            with self.app.app_context():
+                written = Message.apply_status_updates(updates)
+                if not written:
+                    # The workers have let go of these messages; keep their
+                    # leases alive until the outcome is written
+                    Message.renew_leases([update['message_id'] for update in updates])
+            if written:
+                self._failures = 0
+                self._retry_in = None
+                logger.debug(f"Wrote {len(updates)} status updates")
+                return True
+            self._failures += 1
+            if self._failures >= self.max_attempts:
+                logger.error(f"Giving up on {len(updates)} status updates after {self._failures} attempts; "
+                             f"messages {[update['message_id'] for update in updates]} will be handled "
+                             f"as interrupted sends once their leases expire")
+                self._failures = 0
+                self._retry_in = None
+                return False
+            self._retry_in = backoff_delay(self._failures, base=self.interval, cap=Config.SEND_LEASE_TIMEOUT / 3)
+            logger.warning(f"Could not write {len(updates)} status updates "
+                           f"(attempt {self._failures} of {self.max_attempts}), retrying in {self._retry_in:.1f}s")
+            # Put them back ahead of newer outcomes
+            with self._lock:
+                self._updates[:0] = updates
+            return False
+
+    def stop(self, timeout: float = 30):
+        """Stop the writer, then flush what is left so no outcome is lost"""
+        super().stop(timeout)
+        if not self.flush():
+            logger.error(f"Could not write {self.pending()} status updates on shutdown")
@@ -0,0 +1,68 @@
+"""
+SMS encoding detection and segment accounting
+"""
+
+from typing import Dict, Any
+
+# GSM 03.38 default alphabet; each character is one septet
+GSM7_BASIC = set(
+    '@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !"#¤%&\'()*+,-./0123456789:;<=>?'
+    '¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà'
+)
+
+# Extension table; each character is an escape plus one septet
+GSM7_EXTENDED = set('\f^{}\\[~]|€')
+
+# Units per message: single segment, and per segment once a UDH is needed
+SEGMENT_LIMITS = {
+    'gsm7': (160, 153),
+    'ucs2': (70, 67)
+}
+
+def detect_encoding(text: str) -> str:
+    """Return 'gsm7' if every character fits the GSM 7-bit alphabet, else 'ucs2'"""
+    for char in text:
+        if char not in GSM7_BASIC and char not in GSM7_EXTENDED:
+            return 'ucs2'
+    return 'gsm7'
+
+def _char_units(char: str, encoding: str) -> int:
+    """Septets (GSM-7) or UTF-16 code units (UCS-2) a character takes"""
+    if encoding == 'gsm7':
+        return 2 if char in GSM7_EXTENDED else 1
+    return 2 if ord(char) > 0xFFFF else 1
+
+def analyze(text: str) -> Dict[str, Any]:
+    """Work out a message's encoding, length in units and number of segments.
+
+    Escaped GSM-7 characters and UTF-16 surrogate pairs are never split
+    across segments, so the count matches what the modem actually sends.
+    """
+    text = text or ''
+    encoding = detect_encoding(text)
+    single_limit, multi_limit = SEGMENT_LIMITS[encoding]
+    units = sum(_char_units(char, encoding) for char in text)
+
+    if units <= single_limit:
+        segments = 1
+    else:
+        segments = 1
+        used = 0
+        for char in text:
+            size = _char_units(char, encoding)
+            if used + size > multi_limit:
+                segments += 1
+                used = 0
+            used += size
+
+    return {
+        'encoding': encoding,
+        'units': units,
+        'segments': segments,
+        'single_limit': single_limit,
+        'multi_limit': multi_limit
+    }
+
+def count_segments(text: str) -> int:
+    """Number of SMS segments needed for a message"""
+    return analyze(text)['segments']
@@ -0,0 +1,46 @@
+// SMS length and segment counter, mirroring app/sms_encoding.py
+
+const GSM7_BASIC = '@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !"#¤%&\'()*+,-./0123456789:;<=>?' +
+    '¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà';
+const GSM7_EXTENDED = '\f^{}\\[~]|€';
+
+// Work out encoding, length in units and number of SMS parts for a message
+function smsInfo(text) {
+    const chars = Array.from(text || '');
+    const gsm7 = chars.every(char => GSM7_BASIC.includes(char) || GSM7_EXTENDED.includes(char));
+    const size = char => gsm7
+        ? (GSM7_EXTENDED.includes(char) ? 2 : 1)
+        : (char.codePointAt(0) > 0xFFFF ? 2 : 1);
+    const singleLimit = gsm7 ? 160 : 70;
+    const multiLimit = gsm7 ? 153 : 67;
+    const units = chars.reduce((total, char) => total + size(char), 0);
+
+    let segments = 1;
+    if (units > singleLimit) {
+        let used = 0;
+        chars.forEach(char => {
+            const charSize = size(char);
+            if (used + charSize > multiLimit) {
+                segments++;
+                used = 0;
+            }
+            used += charSize;
+        });
+    }
+
+    return {
+        encoding: gsm7 ? 'GSM-7' : 'Unicode',
+        units: units,
+        segments: segments,
+        limit: segments === 1 ? singleLimit : segments * multiLimit
+    };
+}
+
+// Show length, encoding and part count; the counter's data-max-segments marks the limit
+function updateSmsCounter(textarea, counter) {
+    const info = smsInfo(textarea.value);
+    const maxSegments = parseInt(counter.dataset.maxSegments, 10);
+    counter.textContent = `${info.units}/${info.limit} (${info.encoding}), ` +
+        `${info.segments} SMS part${info.segments > 1 ? 's' : ''}`;
+    counter.classList.toggle('over-limit', !isNaN(maxSegments) && info.segments > maxSegments);
+}
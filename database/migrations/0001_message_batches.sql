@@ -0,0 +1,13 @@
+-- Bulk sends: group messages queued together into a batch
+
+CREATE TABLE IF NOT EXISTS message_batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender_id INTEGER NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (sender_id) REFERENCES users(id)
+);
+
+ALTER TABLE messages ADD COLUMN batch_id INTEGER REFERENCES message_batches(id);
+
+CREATE INDEX IF NOT EXISTS idx_messages_batch_id ON messages(batch_id);
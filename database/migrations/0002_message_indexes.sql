@@ -0,0 +1,9 @@
+-- Indexes for the SMS report, phone filter and dispatch queue queries
+
+CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at);
+
+CREATE INDEX IF NOT EXISTS idx_messages_phone_created_at ON messages(phone_number, created_at);
+
+CREATE INDEX IF NOT EXISTS idx_messages_status_queued_at ON messages(status, queued_at);
+
+CREATE INDEX IF NOT EXISTS idx_messages_sender_created_at ON messages(sender_id, created_at);
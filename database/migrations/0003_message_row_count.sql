@@ -0,0 +1,21 @@
+-- Maintained row count so the SMS report never runs COUNT(*) over all messages
+
+CREATE TABLE IF NOT EXISTS row_counts (
+    table_name TEXT PRIMARY KEY,
+    row_count INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR REPLACE INTO row_counts (table_name, row_count)
+SELECT 'messages', COUNT(*) FROM messages;
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_count_insert
+AFTER INSERT ON messages
+BEGIN
+    UPDATE row_counts SET row_count = row_count + 1 WHERE table_name = 'messages';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_count_delete
+AFTER DELETE ON messages
+BEGIN
+    UPDATE row_counts SET row_count = row_count - 1 WHERE table_name = 'messages';
+END;
@@ -0,0 +1,3 @@
+-- Index for SMS report status filters combined with a date range
+
+CREATE INDEX IF NOT EXISTS idx_messages_status_created_at ON messages(status, created_at);
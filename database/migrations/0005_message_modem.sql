@@ -0,0 +1,3 @@
+-- Record which modem each message was handed to
+
+ALTER TABLE messages ADD COLUMN modem_id TEXT;
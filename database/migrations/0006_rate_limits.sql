@@ -0,0 +1,8 @@
+-- Sliding-window rate limit counters shared by all worker processes
+
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    window_index INTEGER NOT NULL,
+    current_count INTEGER NOT NULL DEFAULT 0,
+    previous_count INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
@@ -0,0 +1,9 @@
+-- Latest modem health and pool state, published by the modem owner process
+-- so every web worker can serve /health
+
+CREATE TABLE IF NOT EXISTS modem_status (
+    modem_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
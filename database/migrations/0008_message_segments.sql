@@ -0,0 +1,3 @@
+-- Number of SMS segments each message is sent as, for cost and throughput planning
+
+ALTER TABLE messages ADD COLUMN segments INTEGER NOT NULL DEFAULT 1;
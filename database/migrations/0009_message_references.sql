@@ -0,0 +1,17 @@
+-- TP message references of sent parts, so status reports can be matched back to messages
+
+CREATE TABLE IF NOT EXISTS message_references (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id INTEGER NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    modem_id TEXT,
+    part INTEGER NOT NULL,
+    reference INTEGER NOT NULL,
+    status TEXT,
+    delivery_status INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    reported_at TIMESTAMP
+);
+
+-- References wrap at 256 per modem; reports match the newest unresolved one
+CREATE INDEX IF NOT EXISTS idx_message_references_lookup ON message_references(modem_id, reference, id);
+CREATE INDEX IF NOT EXISTS idx_message_references_message_id ON message_references(message_id);
@@ -0,0 +1,14 @@
+-- Messages received on the modems, drained from SIM storage by the SMS reader
+
+CREATE TABLE IF NOT EXISTS inbound_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    modem_id TEXT,
+    phone_number TEXT NOT NULL,
+    content TEXT NOT NULL,
+    parts INTEGER NOT NULL DEFAULT 1,
+    smsc_time TIMESTAMP,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_inbound_messages_received_at ON inbound_messages(received_at);
+CREATE INDEX IF NOT EXISTS idx_inbound_messages_phone_received_at ON inbound_messages(phone_number, received_at);
@@ -0,0 +1,4 @@
+-- Automatic retry of transient send failures. A message waiting for its
+-- next attempt is 'queued' with queued_at set to when it may be claimed.
+
+ALTER TABLE messages ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,11 @@
+-- Lease on claimed messages. The modem owner renews it while a message is
+-- assigned to a worker; a 'sending' row whose lease has run out was
+-- orphaned by a crash and is recovered by the dispatcher.
+
+ALTER TABLE messages ADD COLUMN lease_expires_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_messages_status_lease ON messages(status, lease_expires_at);
+
+-- Rows already stuck in 'sending' predate leases; backdate them so the very
+-- first recovery pass picks them up
+UPDATE messages SET lease_expires_at = datetime('now', '-1 second') WHERE status = 'sending';
@@ -0,0 +1,5 @@
+-- Deferred sends: a 'scheduled' message is released into the queue at scheduled_at (UTC)
+
+ALTER TABLE messages ADD COLUMN scheduled_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_messages_status_scheduled_at ON messages(status, scheduled_at);
@@ -0,0 +1,28 @@
+-- Template cache invalidation; titles are already unique (schema.sql)
+
+-- Version counter bumped on every template change, so each worker process
+-- can tell with one primary key lookup whether its cached copy is stale
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('templates', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_templates_version_insert
+AFTER INSERT ON templates
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'templates';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_templates_version_update
+AFTER UPDATE ON templates
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'templates';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_templates_version_delete
+AFTER DELETE ON templates
+BEGIN
+    UPDATE cache_versions SET version = version + 1 WHERE name = 'templates';
+END;
@@ -0,0 +1,98 @@
+-- Message counts per hour, status and sender, kept current by triggers so
+-- dashboard statistics never have to count the messages table. A message
+-- counts in the UTC hour it entered its current status; hours are grouped
+-- into days in the app timezone when read, so the triggers stay plain SQL.
+
+CREATE TABLE IF NOT EXISTS message_stats (
+    hour TEXT NOT NULL,
+    status TEXT NOT NULL,
+    sender_id INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, status, sender_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_message_stats_status_hour ON message_stats(status, hour);
+
+INSERT OR REPLACE INTO message_stats (hour, status, sender_id, count)
+SELECT strftime('%Y-%m-%d %H:00:00', COALESCE(CASE m.status
+        WHEN 'queued' THEN m.queued_at
+        WHEN 'sending' THEN m.sending_at
+        WHEN 'sent' THEN m.sent_at
+        WHEN 'delivered' THEN m.delivered_at
+        WHEN 'failed' THEN m.failed_at
+        WHEN 'dead' THEN m.failed_at
+    END, m.created_at)), m.status, m.sender_id, COUNT(*)
+FROM messages m
+GROUP BY 1, 2, 3;
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_stats_insert
+AFTER INSERT ON messages
+BEGIN
+    INSERT INTO message_stats (hour, status, sender_id, count)
+    VALUES (strftime('%Y-%m-%d %H:00:00', COALESCE(CASE NEW.status
+        WHEN 'queued' THEN NEW.queued_at
+        WHEN 'sending' THEN NEW.sending_at
+        WHEN 'sent' THEN NEW.sent_at
+        WHEN 'delivered' THEN NEW.delivered_at
+        WHEN 'failed' THEN NEW.failed_at
+        WHEN 'dead' THEN NEW.failed_at
+    END, NEW.created_at)), NEW.status, NEW.sender_id, 1)
+    ON CONFLICT (hour, status, sender_id) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_stats_update
+AFTER UPDATE OF status ON messages
+WHEN OLD.status IS NOT NEW.status
+BEGIN
+    UPDATE message_stats SET count = count - 1
+    WHERE hour = strftime('%Y-%m-%d %H:00:00', COALESCE(CASE OLD.status
+        WHEN 'queued' THEN OLD.queued_at
+        WHEN 'sending' THEN OLD.sending_at
+        WHEN 'sent' THEN OLD.sent_at
+        WHEN 'delivered' THEN OLD.delivered_at
+        WHEN 'failed' THEN OLD.failed_at
+        WHEN 'dead' THEN OLD.failed_at
+    END, OLD.created_at)) AND status = OLD.status AND sender_id = OLD.sender_id;
+    DELETE FROM message_stats
+    WHERE hour = strftime('%Y-%m-%d %H:00:00', COALESCE(CASE OLD.status
+        WHEN 'queued' THEN OLD.queued_at
+        WHEN 'sending' THEN OLD.sending_at
+        WHEN 'sent' THEN OLD.sent_at
+        WHEN 'delivered' THEN OLD.delivered_at
+        WHEN 'failed' THEN OLD.failed_at
+        WHEN 'dead' THEN OLD.failed_at
+    END, OLD.created_at)) AND status = OLD.status AND sender_id = OLD.sender_id AND count <= 0;
+    INSERT INTO message_stats (hour, status, sender_id, count)
+    VALUES (strftime('%Y-%m-%d %H:00:00', COALESCE(CASE NEW.status
+        WHEN 'queued' THEN NEW.queued_at
+        WHEN 'sending' THEN NEW.sending_at
+        WHEN 'sent' THEN NEW.sent_at
+        WHEN 'delivered' THEN NEW.delivered_at
+        WHEN 'failed' THEN NEW.failed_at
+        WHEN 'dead' THEN NEW.failed_at
+    END, NEW.created_at)), NEW.status, NEW.sender_id, 1)
+    ON CONFLICT (hour, status, sender_id) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_stats_delete
+AFTER DELETE ON messages
+BEGIN
+    UPDATE message_stats SET count = count - 1
+    WHERE hour = strftime('%Y-%m-%d %H:00:00', COALESCE(CASE OLD.status
+        WHEN 'queued' THEN OLD.queued_at
+        WHEN 'sending' THEN OLD.sending_at
+        WHEN 'sent' THEN OLD.sent_at
+        WHEN 'delivered' THEN OLD.delivered_at
+        WHEN 'failed' THEN OLD.failed_at
+        WHEN 'dead' THEN OLD.failed_at
+    END, OLD.created_at)) AND status = OLD.status AND sender_id = OLD.sender_id;
+    DELETE FROM message_stats
+    WHERE hour = strftime('%Y-%m-%d %H:00:00', COALESCE(CASE OLD.status
+        WHEN 'queued' THEN OLD.queued_at
+        WHEN 'sending' THEN OLD.sending_at
+        WHEN 'sent' THEN OLD.sent_at
+        WHEN 'delivered' THEN OLD.delivered_at
+        WHEN 'failed' THEN OLD.failed_at
+        WHEN 'dead' THEN OLD.failed_at
+    END, OLD.created_at)) AND status = OLD.status AND sender_id = OLD.sender_id AND count <= 0;
+END;
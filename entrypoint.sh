@@ -59,6 +59,7 @@ echo "Flask environment:"
 echo "FLASK_APP=$FLASK_APP"
 echo "FLASK_ENV=$FLASK_ENV"
 echo "FLASK_DEBUG=$FLASK_DEBUG"
+echo "SERVER_MODE=${SERVER_MODE:-production}"
 echo "Checking port 4001..."
 netstat -tulpn | grep 4001 || echo "Port 4001 is free"
 echo "Checking Gammu config..."
@@ -71,7 +72,14 @@ ls -la /app/instance
 echo
 ls -la /app/logs
 
-# Start Flask application
-echo "Starting Flask application..."
 cd /app  # Ensure we're in the right directory
-exec python3 -m flask run --host=0.0.0.0 --port=4001 
\ No newline at end of file
+
+# Start the application
+if [ "${SERVER_MODE:-production}" = "development" ]; then
+    echo "Starting Flask development server..."
+    exec python3 -m flask run --host=0.0.0.0 --port=4001
+else
+    # One process owns the modems; the others only enqueue messages
+    echo "Starting gunicorn with ${WEB_WORKERS:-2} workers and ${WEB_THREADS:-4} threads per worker..."
+    exec gunicorn --config /app/gunicorn.conf.py "app:create_app()"
+fi 
\ No newline at end of file
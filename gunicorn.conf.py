@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for production mode (SERVER_MODE=production)
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('FLASK_RUN_PORT', '4001')}"
+workers = int(os.environ.get('WEB_WORKERS', 2))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+# Slow report pages and exports should not get workers killed
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'INFO').lower()
+
+# Never preload: each worker must open its own database connections and,
+# if it wins the modem lock, its own serial ports
+
+def worker_exit(server, worker):
+    """Stop the background workers and release the modems when a worker exits"""
+    from app import cleanup_services
+    cleanup_services()
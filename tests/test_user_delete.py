@@ -0,0 +1,46 @@
+"""
+Deleting users who have message history
+"""
+
+import pytest
+from app import create_app
+from app.config import Config
+from app.database import get_db
+from app.models import User, Message
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATABASE', str(tmp_path / 'database.db'))
+    app = create_app(start_workers=False)
+    app.config['TESTING'] = True
+    return app
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['is_admin'] = True
+    return client
+
+def test_user_with_messages_is_not_deleted(app, admin_client):
+    with app.app_context():
+        User.create('alice', 'secret')
+        Message.create('07700900001', 'hello', User.get_by_username('alice')['id'])
+
+    response = admin_client.post('/admin/users/delete', data={'username': 'alice'}, follow_redirects=True)
+
+    assert b'alice has sent messages or saved templates and cannot be deleted' in response.data
+    with app.app_context():
+        assert User.get_by_username('alice') is not None
+        assert get_db().execute('SELECT COUNT(*) FROM messages').fetchone()[0] == 1
+
+def test_user_without_history_is_deleted(app, admin_client):
+    with app.app_context():
+        User.create('bob', 'secret')
+
+    response = admin_client.post('/admin/users/delete', data={'username': 'bob'}, follow_redirects=True)
+
+    assert b'User deleted successfully' in response.data
+    with app.app_context():
+        assert User.get_by_username('bob') is None